@@ -1,15 +1,24 @@
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, request, jsonify
 from flasgger import Swagger, swag_from
 from flask_cors import CORS
 from marshmallow import Schema, fields, validate, ValidationError
-from services.data_loader import DataLoader
-from services.content_based import ContentBasedFilter
-from services.collaborative_filtering import CollaborativeFilter
+from services.artifacts import current_version_dir
 from services.hybrid_recommender import HybridRecommender
+from services.executor import SourceExecutor
+from services.lazy import LazyModel, NotReadyError
+from services.model_store import ModelSnapshot, ModelStore
+from services.metrics import CONTENT_TYPE, REGISTRY, REQUEST_SECONDS, STAGE_SECONDS
+from services.request_log import RequestLog
+from config import Config
 import logging
 
-# Configure logging
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+# Configure logging: operational logs go to app.log, request payloads to the sampled request log.
+# force: the service modules imported above already configured the root logger. delay: the file
+# is only created when the first record is written, not on import
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', force=True,
+                    handlers=[logging.FileHandler(Config.LOG_PATH, delay=True)])
+request_log = RequestLog()
 
 # Initialize Flask and Swagger
 app = Flask(__name__)
@@ -21,26 +30,133 @@ class WeightsSchema(Schema):
     item_based = fields.Float(missing=0.2)
     user_based = fields.Float(missing=0.2)
     content_based = fields.Float(missing=0.6)
+    matrix_factorization = fields.Float(missing=0.0)
 
 class RecommendInputSchema(Schema):
     watched_movies = fields.List(fields.List(fields.Int()), required=True)
     top_n = fields.Int(missing=20, validate=validate.Range(min=1))
     weights = fields.Nested(WeightsSchema, missing=None)
+    genre = fields.Str(missing=None)
+    aggregation = fields.Str(missing=Config.GROUP_AGGREGATION,
+                             validate=validate.OneOf(HybridRecommender.AGGREGATIONS))
+
+class RatingEventSchema(Schema):
+    userId = fields.Int(required=True)
+    movieId = fields.Int(required=True)
+    rating = fields.Float(required=True, validate=validate.Range(min=0.5, max=5.0))
+
+class IngestInputSchema(Schema):
+    ratings = fields.List(fields.Nested(RatingEventSchema), required=True, validate=validate.Length(min=1))
 
 input_schema = RecommendInputSchema()
+ingest_schema = IngestInputSchema()
 
-# Initialize recommendation system
-try:
-    data_loader = DataLoader()
-    movies_df, ratings_df, user_item_matrix = data_loader.load_data()
+def load_models(published):
+    """Serve ``published`` (a PublishedModels) from now on, replacing the module-level serving state.
+
+    serve.py calls this in its parent process to load a newly published version before
+    forking the workers that serve it.
+    """
+    global models, data_loader, movies_df, executor, recommender, model_store, ingestion_disabled
+    if Config.EXECUTOR_TYPE == 'process':
+        # Process workers are forked with the sources registered at start, so every source is loaded first
+        published.warm_up(wait=True)
+    elif Config.WARM_UP:
+        published.warm_up()
+    models = published
+    data_loader = models.data_loader
+    movies_df = models.movies_df
+
+    executor = SourceExecutor()
+    recommender = HybridRecommender(movies_df, models.content_filter, models.collaborative_filter,
+                                    popularity_model=models.popularity_model, movie_index=data_loader.movie_index,
+                                    executor=executor, matrix_factorization=models.matrix_factorization)
+    if executor.kind == 'process':
+        executor.start(recommender.source_functions())
+        ingestion_disabled = ("Ratings cannot be ingested with RECOMMENDER_EXECUTOR=process: the source "
+                              "workers keep serving the models they were forked with")
+    model_store = ModelStore(ModelSnapshot(recommender, models.raters_index))
+
+def _load_version(version_dir):
+    # pandas and the model classes are imported here, off the import path of the app
+    from services.pipeline import PublishedModels
+
+    load_models(PublishedModels(version_dir))
+    return version_dir.name
 
-    content_filter = ContentBasedFilter(movies_df)
-    collaborative_filter = CollaborativeFilter(user_item_matrix)
-    recommender = HybridRecommender(movies_df, content_filter, collaborative_filter)
+def require_models(timeout=Config.MODEL_WAIT_TIMEOUT):
+    """Wait until the models are loaded; NotReadyError after ``timeout`` seconds."""
+    startup.get(timeout)
+
+# Модели, опубликованные build_models.py, загружаются в фоновом потоке: импорт модуля,
+# /health, /ready и Swagger не ждут их. Отсутствие опубликованной версии — ошибка сразу
+models = data_loader = movies_df = executor = recommender = model_store = None
+# Причина, по которой POST /ratings отклоняется (None — приём рейтингов разрешён)
+ingestion_disabled = None
+try:
+    startup = LazyModel('models', _load_version, current_version_dir(Config.ARTIFACTS_DIR)).start()
 except Exception as e:
     logging.error(f"Failed to initialize recommendation system: {e}")
     raise
 
+def prepare_group_request(data):
+    """Validate a /recommend/group body and resolve it against the current model snapshot.
+
+    Returns the snapshot and the keyword arguments for its recommender, so every serving
+    mode (Flask, ASGI micro-batching) handles the request contract identically. Raises
+    NotReadyError while the models are still loading.
+    """
+    require_models()
+
+    # Validate input
+    with STAGE_SECONDS.time(stage='validation'):
+        validated = input_schema.load(data)
+
+    watched_movies_groups = validated['watched_movies']
+
+    # Конвертируем db_id -> movieId для всех групп через индекс идентификаторов
+    movieid_groups = []
+    all_watched_movie_ids = set()
+
+    with STAGE_SECONDS.time(stage='id_conversion'):
+        for group in watched_movies_groups:
+            converted_group = data_loader.movie_index.to_movie_ids(group).tolist()
+            movieid_groups.append(converted_group)
+            all_watched_movie_ids.update(converted_group)
+
+        # Валидируем существование movieId
+        data_loader.validate_movie_ids(all_watched_movie_ids)
+
+    # Берём текущий снимок моделей один раз на весь запрос
+    snapshot = model_store.current
+
+    # Извлекаем уникальные user_ids по всем фильмам через индекс movieId -> userId;
+    # при агрегации по участникам — отдельно для каждого участника
+    aggregation = validated['aggregation']
+    members = None
+    with STAGE_SECONDS.time(stage='raters_union'):
+        if aggregation == 'union':
+            user_ids = snapshot.raters_index.union_groups(movieid_groups)
+        else:
+            members = [(group, snapshot.raters_index.union(group)) for group in movieid_groups]
+            user_ids = None
+
+    return snapshot, {
+        'user_ids': user_ids,
+        'watched_movies': all_watched_movie_ids,
+        'top_n': validated['top_n'],
+        'weights': validated.get('weights'),
+        'genre': validated.get('genre'),
+        'members': members,
+        'aggregation': aggregation,
+    }
+
+def record_request(endpoint, payload, status, start, count=None):
+    """Export a finished request's latency and hand it to the sampled request log."""
+    seconds = time.perf_counter() - start
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+    request_log.record(endpoint, payload, status, seconds, count)
+
 @app.route('/recommend/group', methods=['POST'])
 @swag_from({
     'tags': ['Recommendations'],
@@ -69,8 +185,24 @@ except Exception as e:
                         'properties': {
                             'item_based': {'type': 'number', 'default': 0.2},
                             'user_based': {'type': 'number', 'default': 0.2},
-                            'content_based': {'type': 'number', 'default': 0.6}
+                            'content_based': {'type': 'number', 'default': 0.6},
+                            'matrix_factorization': {
+                                'type': 'number',
+                                'default': 0.0,
+                                'description': 'Only accepted when the server runs with RECOMMENDER_MF=1'
+                            }
                         }
+                    },
+                    'genre': {
+                        'type': 'string',
+                        'description': 'Only used when watched_movies is empty: restrict popular movies to this genre'
+                    },
+                    'aggregation': {
+                        'type': 'string',
+                        'enum': list(HybridRecommender.AGGREGATIONS),
+                        'default': Config.GROUP_AGGREGATION,
+                        'description': 'union merges all watched lists into one; the others score every '
+                                       'member separately and combine the member scores'
                     }
                 },
                 'required': ['watched_movies']
@@ -91,55 +223,119 @@ except Exception as e:
             }
         },
         400: {'description': 'Validation error'},
-        500: {'description': 'Internal server error'}
+        500: {'description': 'Internal server error'},
+        503: {'description': 'Models are still loading'}
     }
 })
 def group_recommendation():
+    start = time.perf_counter()
+    data = None
     try:
         data = request.get_json()
-        logging.info(f"Received request: {data}")
 
-        # Validate input
-        validated = input_schema.load(data)
+        snapshot, recommendation_request = prepare_group_request(data)
 
-        watched_movies_groups = validated['watched_movies']
-        top_n = validated['top_n']
-        weights = validated.get('weights')
+        # Получаем рекомендации
+        recommendations = snapshot.recommender.get_recommendations(**recommendation_request)
 
-        # Получаем маппинг db_id -> movieId
-        dbid_to_movieid = data_loader.dbid_to_movieid
+        with STAGE_SECONDS.time(stage='response'):
+            response = jsonify({
+                'recommendations': recommendations,
+                'count': len(recommendations)
+            })
+        record_request('/recommend/group', data, 200, start, len(recommendations))
+        return response
 
-        # Конвертируем db_id -> movieId для всех групп
-        movieid_groups = []
-        all_watched_movie_ids = set()
+    except NotReadyError as e:
+        logging.warning(f"Not ready: {e}")
+        record_request('/recommend/group', data, 503, start)
+        return jsonify({'error': str(e)}), 503
+    except ValidationError as ve:
+        logging.error(f"Validation error: {ve}")
+        record_request('/recommend/group', data, 400, start)
+        return jsonify({'error': ve.messages}), 400
+    except ValueError as ve:
+        logging.error(f"Invalid input: {ve}")
+        record_request('/recommend/group', data, 400, start)
+        return jsonify({'error': str(ve)}), 400
+    except Exception as e:
+        logging.error(f"Server error: {e}")
+        record_request('/recommend/group', data, 500, start)
+        return jsonify({'error': str(e)}), 500
 
-        for group in watched_movies_groups:
-            converted_group = [
-                dbid_to_movieid[dbid]
-                for dbid in group
-                if dbid in dbid_to_movieid
-            ]
-            movieid_groups.append(converted_group)
-            all_watched_movie_ids.update(converted_group)
-        
-        # Валидируем существование movieId
-        data_loader.validate_movie_ids(all_watched_movie_ids)
 
-        # Извлекаем user_ids по всем фильмам
-        user_ids = []
-        for group in movieid_groups:
-            group_user_ids = ratings_df[ratings_df['movieId'].isin(group)]['userId'].unique()
-            user_ids.extend(group_user_ids)
+@app.route('/ratings', methods=['POST'])
+@swag_from({
+    'tags': ['Ratings'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'ratings': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'userId': {'type': 'integer'},
+                                'movieId': {'type': 'integer'},
+                                'rating': {'type': 'number'}
+                            },
+                            'required': ['userId', 'movieId', 'rating']
+                        }
+                    }
+                },
+                'required': ['ratings']
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Ratings applied to the serving model',
+            'examples': {
+                'application/json': {'ingested': 2, 'version': 1}
+            }
+        },
+        400: {'description': 'Validation error'},
+        409: {'description': 'Ingestion is not supported in this deployment mode'},
+        500: {'description': 'Internal server error'},
+        503: {'description': 'Models are still loading'}
+    }
+})
+def ingest():
+    try:
+        require_models()
+        if ingestion_disabled:
+            # Принятые рейтинги никто бы не увидел — лучше отказать явно
+            return jsonify({'error': ingestion_disabled}), 409
+        validated = ingest_schema.load(request.get_json())
+        events = validated['ratings']
+
+        # movieId в API — это db_id, конвертируем в movieId датасета
+        db_ids = [event['movieId'] for event in events]
+        known = data_loader.movie_index.has_db_ids(db_ids)
+        if not known.all():
+            unknown_ids = sorted({db_id for db_id, is_known in zip(db_ids, known) if not is_known})
+            raise ValueError(f"Invalid movie IDs: {unknown_ids}")
 
-        # Получаем рекомендации
-        recommendations = recommender.get_recommendations(user_ids, all_watched_movie_ids, top_n, weights)
-        
-        logging.info(f"Returning {len(recommendations)} unique recommendations")
-        return jsonify({
-            'recommendations': recommendations,
-            'count': len(recommendations)
-        })
+        # Тянет pandas через индексы рейтингов, поэтому импортируется при первом запросе
+        from services.ingestion import ingest_ratings
+
+        snapshot = ingest_ratings(
+            model_store,
+            [event['userId'] for event in events],
+            data_loader.movie_index.to_movie_ids(db_ids),
+            [event['rating'] for event in events],
+        )
+        return jsonify({'ingested': len(events), 'version': snapshot.version})
 
+    except NotReadyError as e:
+        logging.warning(f"Not ready: {e}")
+        return jsonify({'error': str(e)}), 503
     except ValidationError as ve:
         logging.error(f"Validation error: {ve}")
         return jsonify({'error': ve.messages}), 400
@@ -151,5 +347,79 @@ def group_recommendation():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/cache/stats', methods=['GET'])
+@swag_from({
+    'tags': ['Recommendations'],
+    'responses': {
+        200: {
+            'description': 'Hit/miss counters of the recommendation result cache',
+            'examples': {
+                'application/json': {'hits': 10, 'misses': 3, 'evictions': 0, 'size': 3, 'maxsize': 1024}
+            }
+        },
+        503: {'description': 'Models are still loading'}
+    }
+})
+def cache_stats():
+    if not startup.ready:
+        return jsonify({'error': 'Models are still loading'}), 503
+    return jsonify(model_store.current.recommender.result_cache.stats())
+
+
+@app.route('/health', methods=['GET'])
+@swag_from({
+    'tags': ['Monitoring'],
+    'responses': {
+        200: {'description': 'The process is up; answered before the models are loaded'}
+    }
+})
+def health():
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/ready', methods=['GET'])
+@swag_from({
+    'tags': ['Monitoring'],
+    'responses': {
+        200: {
+            'description': 'The models are loaded and at least one recommendation source is ready; '
+                           'sources still loading are reported and left out of recommendations',
+            'examples': {
+                'application/json': {
+                    'ready': True,
+                    'models': 'ready',
+                    'version': '20240101T000000-1a2b3c',
+                    'sources': {'item_based': 'ready', 'user_based': 'ready', 'content_based': 'loading'}
+                }
+            }
+        },
+        503: {'description': 'Not ready yet, or the models failed to load; same body'}
+    }
+})
+def ready():
+    # Статусы: cold, loading, ready, failed
+    sources = model_store.current.recommender.source_status() if startup.ready else {}
+    is_ready = 'ready' in sources.values()
+    return jsonify({
+        'ready': is_ready,
+        'models': startup.status(),
+        'version': models.version_dir.name if startup.ready else None,
+        'sources': sources,
+    }), 200 if is_ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+@swag_from({
+    'tags': ['Monitoring'],
+    'produces': ['text/plain'],
+    'responses': {
+        200: {'description': 'Stage latency histograms, cache and candidate pool counters and model '
+                             'load/build durations in the Prometheus text format'}
+    }
+})
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8082)
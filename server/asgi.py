@@ -0,0 +1,101 @@
+"""ASGI serving mode: micro-batches concurrent /recommend/group requests.
+
+Run with ``uvicorn asgi:app --host 0.0.0.0 --port 8082``. Group recommendation
+requests arriving within ``Config.BATCH_MAX_WAIT`` of each other are scored together
+(up to ``Config.BATCH_MAX_SIZE``) with one pass per source; every other route is
+served by the Flask app unchanged.
+"""
+import asyncio
+import json
+import time
+from asgiref.wsgi import WsgiToAsgi
+from marshmallow import ValidationError
+from api import app as flask_app, prepare_group_request, record_request, require_models, startup
+from config import Config
+from services.batcher import MicroBatcher
+from services.lazy import NotReadyError
+from services.metrics import BATCH_SIZE, STAGE_SECONDS
+import logging
+
+def process_batch(items):
+    """Score a batch of ``(snapshot, request)`` items, one recommender call per snapshot."""
+    results = [None] * len(items)
+    by_snapshot = {}
+    for i, (snapshot, recommendation_request) in enumerate(items):
+        by_snapshot.setdefault(id(snapshot), (snapshot, []))[1].append(i)
+
+    for snapshot, positions in by_snapshot.values():
+        batch = snapshot.recommender.get_recommendations_batch([items[i][1] for i in positions])
+        for i, result in zip(positions, batch):
+            results[i] = result
+    BATCH_SIZE.observe(len(items))
+    return results
+
+batcher = MicroBatcher(process_batch, Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT)
+flask_asgi = WsgiToAsgi(flask_app)
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                    (b'access-control-allow-origin', b'*')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def group_recommendation(receive, send):
+    start = time.perf_counter()
+    data = None
+    try:
+        data = json.loads(await read_body(receive) or b'null')
+        loop = asyncio.get_running_loop()
+        if not startup.ready:
+            # Wait for the models off the event loop, which keeps serving the other routes
+            await loop.run_in_executor(None, require_models)
+
+        # Validation and the raters union grow with the group's ratings, so they run off the loop too
+        snapshot, recommendation_request = await loop.run_in_executor(None, prepare_group_request, data)
+        recommendations = await batcher.submit((snapshot, recommendation_request))
+
+        with STAGE_SECONDS.time(stage='response'):
+            await send_json(send, {
+                'recommendations': recommendations,
+                'count': len(recommendations)
+            })
+        record_request('/recommend/group', data, 200, start, len(recommendations))
+
+    except NotReadyError as e:
+        logging.warning(f"Not ready: {e}")
+        await send_json(send, {'error': str(e)}, 503)
+        record_request('/recommend/group', data, 503, start)
+    except ValidationError as ve:
+        logging.error(f"Validation error: {ve}")
+        await send_json(send, {'error': ve.messages}, 400)
+        record_request('/recommend/group', data, 400, start)
+    except ValueError as ve:
+        logging.error(f"Invalid input: {ve}")
+        await send_json(send, {'error': str(ve)}, 400)
+        record_request('/recommend/group', data, 400, start)
+    except Exception as e:
+        logging.error(f"Server error: {e}")
+        await send_json(send, {'error': str(e)}, 500)
+        record_request('/recommend/group', data, 500, start)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == '/recommend/group' and scope['method'] == 'POST':
+        await group_recommendation(receive, send)
+    else:
+        await flask_asgi(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8082)
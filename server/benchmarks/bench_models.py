@@ -0,0 +1,150 @@
+"""Time and memory-profile model building and the recommendation hot paths.
+
+    python -m benchmarks.bench_models [--scale 10000:5000 --scale 1000000:50000]
+                                      [--group-sizes 1 2 4 8] [--repeat 20] [--output results.json]
+
+Each ``--scale`` is ``ratings:movies``. For every scale a synthetic dataset is generated,
+then data loading, model initialization (built from scratch and reloaded from the cache),
+each source's scoring and the hybrid recommender per group size are measured. Hybrid
+requests bypass the result cache unless ``--cached`` is given.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+from benchmarks.common import measure, write_results
+from benchmarks.synthetic import generate
+from config import Config
+from services.collaborative_filtering import CollaborativeFilter
+from services.content_based import ContentBasedFilter
+from services.data_loader import DataLoader
+from services.executor import SourceExecutor
+from services.hybrid_recommender import HybridRecommender
+from services.matrix_factorization import MatrixFactorization
+from services.popularity import PopularityModel
+from services.raters_index import RatersIndex
+from services.result_cache import ResultCache
+import logging
+
+DEFAULT_SCALES = ['10000:5000', '100000:5000', '1000000:50000']
+
+def sample_groups(ratings_df, group_size, n_groups, watched_per_member, rng):
+    """Draw groups whose members each watched popular-weighted movies, like real users."""
+    counts = ratings_df['movieId'].value_counts()
+    movie_ids, weights = counts.index.to_numpy(), counts.to_numpy() / counts.sum()
+    return [
+        [rng.choice(movie_ids, min(watched_per_member, len(movie_ids)), replace=False, p=weights).tolist()
+         for _ in range(group_size)]
+        for _ in range(n_groups)
+    ]
+
+def bench_scale(n_ratings, n_movies, args):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        movies_path, ratings_path = generate(Path(tmp) / 'data', n_ratings, n_movies, seed=args.seed,
+                                             file_format=args.format)
+        cache_dir = Path(tmp) / 'cache'
+
+        results['load_data'], (movies_df, ratings_df, user_item_matrix) = measure(
+            lambda: DataLoader(movies_path, ratings_path).load_data(), repeat=1)
+        loader = DataLoader(movies_path, ratings_path)
+        loader.load_data()
+
+        # Built from scratch (fresh cache dir per call), then memory-mapped from the cache
+        build_dirs = iter(Path(tmp) / f"build-{i}" for i in range(10))
+        results['content_build'], _ = measure(lambda: ContentBasedFilter(movies_df, cache_dir=next(build_dirs)))
+        results['collaborative_build'], _ = measure(
+            lambda: CollaborativeFilter(user_item_matrix, cache_dir=next(build_dirs)))
+        content_filter = ContentBasedFilter(movies_df, cache_dir=cache_dir)
+        collaborative_filter = CollaborativeFilter(user_item_matrix, cache_dir=cache_dir)
+        results['content_load'], _ = measure(lambda: ContentBasedFilter(movies_df, cache_dir=cache_dir))
+        results['collaborative_load'], _ = measure(lambda: CollaborativeFilter(user_item_matrix, cache_dir=cache_dir))
+        results['popularity_build'], popularity_model = measure(
+            lambda: PopularityModel.from_ratings(ratings_df, movies_df))
+        results['raters_index_build'], raters_index = measure(
+            lambda: RatersIndex.from_user_item_matrix(user_item_matrix))
+
+        matrix_factorization = None
+        if args.matrix_factorization:
+            results['matrix_factorization_build'], matrix_factorization = measure(
+                lambda: MatrixFactorization(user_item_matrix, cache_dir=next(build_dirs)), memory=False)
+
+        executor = SourceExecutor('thread', timeout=None)
+        cache = ResultCache() if args.cached else ResultCache(maxsize=0)
+        recommender = HybridRecommender(movies_df, content_filter, collaborative_filter, result_cache=cache,
+                                        popularity_model=popularity_model, movie_index=loader.movie_index,
+                                        executor=executor, matrix_factorization=matrix_factorization,
+                                        rng=args.seed)
+        executor.start()
+
+        rng = np.random.default_rng(args.seed)
+        for group_size in args.group_sizes:
+            groups = sample_groups(ratings_df, group_size, args.repeat, args.watched, rng)
+            watched_sets = [{movie_id for member in group for movie_id in member} for group in groups]
+            user_id_sets = [raters_index.union_groups(group) for group in groups]
+            calls = iter(range(10 ** 9))
+
+            def one(fn):
+                # Every timed call scores the next sampled group
+                return lambda: fn(next(calls) % len(groups))
+
+            prefix = f"group_{group_size}"
+            results[f"{prefix}/raters_union"], _ = measure(
+                one(lambda i: raters_index.union_groups(groups[i])), repeat=args.repeat)
+            results[f"{prefix}/content_based"], _ = measure(
+                one(lambda i: content_filter.get_scores([watched_sets[i]], args.top_n * 3)), repeat=args.repeat)
+            results[f"{prefix}/item_based"], _ = measure(
+                one(lambda i: collaborative_filter.item_based_scores([watched_sets[i]], args.top_n * 3)),
+                repeat=args.repeat)
+            results[f"{prefix}/user_based"], _ = measure(
+                one(lambda i: collaborative_filter.user_based_scores([user_id_sets[i]], args.top_n * 3)),
+                repeat=args.repeat)
+            if matrix_factorization is not None:
+                results[f"{prefix}/matrix_factorization"], _ = measure(
+                    one(lambda i: matrix_factorization.get_scores([watched_sets[i]], args.top_n * 3)),
+                    repeat=args.repeat)
+            results[f"{prefix}/hybrid"], _ = measure(
+                one(lambda i: recommender.get_recommendations(user_id_sets[i], watched_sets[i], args.top_n)),
+                repeat=args.repeat)
+            results[f"{prefix}/hybrid_batch"], _ = measure(
+                lambda: recommender.get_recommendations_batch([
+                    {'user_ids': user_ids, 'watched_movies': watched, 'top_n': args.top_n}
+                    for user_ids, watched in zip(user_id_sets, watched_sets)
+                ]), repeat=1)
+        executor.shutdown()
+
+    results['dataset'] = {'ratings': int(user_item_matrix.nnz), 'movies': int(len(movies_df)),
+                          'users': int(user_item_matrix.shape[0])}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model building and recommendation hot paths")
+    parser.add_argument('--scale', action='append', help="ratings:movies, repeatable")
+    parser.add_argument('--group-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--watched', type=int, default=10, help="watched movies per group member")
+    parser.add_argument('--top-n', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20, help="timed calls per hot path")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--matrix-factorization', action='store_true', help="also benchmark the ALS source")
+    parser.add_argument('--cached', action='store_true', help="let hybrid requests hit the result cache")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results/models.json')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for scale in args.scale or DEFAULT_SCALES:
+        n_ratings, n_movies = (int(value) for value in scale.split(':'))
+        print(f"Benchmarking {n_ratings} ratings x {n_movies} movies")
+        results[scale] = bench_scale(n_ratings, n_movies, args)
+        for name, stats in results[scale].items():
+            if 'mean_ms' in stats:
+                print(f"  {name:36s} {stats['mean_ms']:10.2f} ms  p99 {stats['p99_ms']:10.2f} ms"
+                      f"  peak {stats.get('peak_mb', float('nan')):8.1f} MB")
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    params['config'] = {'neighbour_k': Config.NEIGHBOUR_K, 'content_ann_min_items': Config.CONTENT_ANN_MIN_ITEMS}
+    write_results(args.output, 'models', params, results)
+
+if __name__ == '__main__':
+    main()
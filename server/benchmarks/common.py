@@ -0,0 +1,78 @@
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+def measure(fn, repeat=1, memory=True):
+    """Time ``fn`` over ``repeat`` calls and trace the peak memory it allocates in one more call.
+
+    Memory is traced in a separate call because tracemalloc slows allocation-heavy code
+    down. NumPy reports its buffers to tracemalloc, so array memory is included.
+    Returns (stats, result of the last call).
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    durations = np.asarray(durations) * 1000
+    stats = {
+        'calls': repeat,
+        'mean_ms': float(durations.mean()),
+        'p50_ms': float(np.percentile(durations, 50)),
+        'p99_ms': float(np.percentile(durations, 99)),
+        'min_ms': float(durations.min()),
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return stats, result
+
+def latency_stats(latencies_ms, elapsed_s, errors=0):
+    """Summarize request latencies the way load tests report them."""
+    latencies_ms = np.asarray(latencies_ms, dtype=np.float64)
+    if len(latencies_ms) == 0:
+        return {'requests': 0, 'errors': errors, 'throughput_rps': 0.0}
+    return {
+        'requests': int(len(latencies_ms)),
+        'errors': int(errors),
+        'throughput_rps': float(len(latencies_ms) / elapsed_s),
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p90_ms': float(np.percentile(latencies_ms, 90)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(latencies_ms.max()),
+    }
+
+def environment():
+    """Describe the machine and code version a result was produced on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def write_results(path, kind, params, results):
+    """Write one benchmark run as JSON so runs can be compared with ``benchmarks.compare``."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'kind': kind, 'environment': environment(), 'params': params, 'results': results}, f, indent=2)
+    print(f"Results written to {path}")
@@ -0,0 +1,56 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.10]
+
+Latencies (``*_ms``) and memory (``peak_mb``) that grew by more than ``--threshold``
+and throughput that dropped by more than it are reported as regressions; the exit
+status is 1 when there is any, so the comparison can gate CI.
+"""
+import argparse
+import json
+import sys
+
+COMPARED = ('mean_ms', 'p50_ms', 'p99_ms', 'peak_mb', 'throughput_rps')
+
+def flatten(results, prefix=''):
+    """Yield (path, metric, value) for every compared metric in a results tree."""
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}/")
+        elif key in COMPARED and isinstance(value, (int, float)):
+            yield prefix.rstrip('/'), key, float(value)
+
+def compare(baseline, candidate, threshold):
+    old = {(path, metric): value for path, metric, value in flatten(baseline['results'])}
+    rows = []
+    for path, metric, new_value in flatten(candidate['results']):
+        old_value = old.get((path, metric))
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        worse = -change if metric == 'throughput_rps' else change
+        rows.append((path, metric, old_value, new_value, change, worse > threshold))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    for path, metric, old_value, new_value, change, regressed in rows:
+        marker = 'REGRESSION' if regressed else ''
+        print(f"{path:50s} {metric:15s} {old_value:12.2f} -> {new_value:12.2f} {change:+8.1%} {marker}")
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regression(s) over {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
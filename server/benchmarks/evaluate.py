@@ -0,0 +1,383 @@
+"""Offline evaluation of recommendation quality against latency and memory.
+
+    python -m benchmarks.evaluate [--movies PATH] [--ratings PATH] [--split temporal|leave-k-out]
+                                  [--folds 3] [--k 10 20] [--weights 0.2:0.2:0.6 ...] [--grid-step 0.5]
+                                  [--workers N] [--target-ndcg 0.05] [--latency-budget-ms 50]
+                                  [--output benchmark_results/evaluation.json]
+
+``temporal`` folds train on the ratings before a cutoff and test on the next time window
+(an expanding window); ``leave-k-out`` folds hold out ``--holdout`` random ratings of a
+disjoint group of users each. Every fold's models are built from its training ratings
+only, in parallel, and memory-mapped by this process, so the evaluation workers forked
+afterwards share one copy of them.
+
+Held-out users are queried the way the API is: their training movies are the watched
+set and the raters of those movies seed the user-based source. Each source on its own,
+the popularity baseline and every weight-grid point through HybridRecommender are scored
+in batches of ``--batch-size`` users at every ``k``, one (fold, configuration, k) job per
+worker, against the held-out movies rated at least ``--relevant-rating``. Latency is per
+request (batch time over batch size) and memory the peak traced while scoring one batch.
+Workers run concurrently, so use ``--workers 1`` when latencies must be exact.
+
+Only the hybrid weightings can be deployed (as ``Config.WEIGHTS`` or request weights), so
+results are marked ``deployable`` and the best configuration is chosen among those; the
+single sources and popularity are reported as baselines.
+"""
+import argparse
+import itertools
+import multiprocessing
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from benchmarks.common import write_results
+from config import Config
+from services.collaborative_filtering import CollaborativeFilter
+from services.content_based import ContentBasedFilter
+from services.data_loader import RATING_DTYPES, DataLoader, read_table
+from services.executor import SourceExecutor
+from services.hybrid_recommender import HybridRecommender
+from services.matrix_factorization import MatrixFactorization
+from services.pipeline import POPULARITY_NAME, USER_ITEM_MATRIX_NAME
+from services.popularity import PopularityModel
+from services.raters_index import RatersIndex
+from services.result_cache import ResultCache
+from services.user_item_matrix import UserItemMatrix
+import logging
+
+SOURCES = ('item_based', 'user_based', 'content_based', 'matrix_factorization', 'popular')
+
+# Training and held-out ratings of one fold
+Fold = namedtuple('Fold', ['name', 'train', 'test'])
+# Held-out users of one fold with their watched sets, user-based seeds and relevant movies
+Queries = namedtuple('Queries', ['user_ids', 'watched', 'raters', 'relevant'])
+
+# Folds, models and queries shared with the forked workers
+_eval_context = {}
+
+def temporal_splits(ratings_df, n_folds=3, test_fraction=0.1):
+    """Split by time: fold i tests the i-th of the last ``n_folds`` windows of ``test_fraction``
+    of the ratings each and trains on every rating before its window."""
+    if n_folds * test_fraction >= 1:
+        raise ValueError("folds x test fraction must leave ratings to train on")
+    ratings_df = ratings_df.sort_values('timestamp', kind='stable')
+    n_ratings = len(ratings_df)
+    folds = []
+    for i in range(n_folds):
+        start = int(n_ratings * (1 - (n_folds - i) * test_fraction))
+        end = int(n_ratings * (1 - (n_folds - i - 1) * test_fraction))
+        folds.append(Fold(f"temporal-{i}", ratings_df.iloc[:start], ratings_df.iloc[start:end]))
+    return folds
+
+def leave_k_out_splits(ratings_df, n_folds=3, k=5, seed=0):
+    """Split by user: users with more than ``k`` ratings are divided into ``n_folds`` groups,
+    and fold i holds out ``k`` random ratings of every user in group i."""
+    rng = np.random.default_rng(seed)
+    counts = ratings_df['userId'].value_counts()
+    groups = np.array_split(rng.permutation(counts.index[counts > k].to_numpy()), n_folds)
+
+    shuffled = ratings_df.iloc[rng.permutation(len(ratings_df))]
+    # The first k rows of each user in random order are their held-out candidates
+    first_k = (shuffled.groupby('userId', sort=False).cumcount() < k).to_numpy()
+    folds = []
+    for i, users in enumerate(groups):
+        held_out = first_k & shuffled['userId'].isin(users).to_numpy()
+        folds.append(Fold(f"leave-{k}-out-{i}", shuffled[~held_out], shuffled[held_out]))
+    return folds
+
+def build_queries(fold, raters_index, relevant_rating, max_users, rng):
+    """Pick the fold's test users with a training history and a relevant held-out movie."""
+    test = fold.test[fold.test['rating'] >= relevant_rating]
+    relevant = test.groupby('userId')['movieId'].agg(set)
+    history = fold.train[fold.train['userId'].isin(relevant.index)].groupby('userId')['movieId'].agg(set)
+
+    user_ids = []
+    for user_id in rng.permutation(np.intersect1d(relevant.index.to_numpy(), history.index.to_numpy())):
+        # Re-rated movies were already watched and cannot be recommended
+        if relevant[user_id] - history[user_id]:
+            user_ids.append(user_id)
+            if len(user_ids) == max_users:
+                break
+    user_ids = np.sort(np.array(user_ids, dtype=np.int64))
+    watched = [history[user_id] for user_id in user_ids]
+    return Queries(user_ids, watched, [raters_index.union(movie_ids) for movie_ids in watched],
+                   [relevant[user_id] - history[user_id] for user_id in user_ids])
+
+def ranking_metrics(recommended, relevant, k):
+    """Mean precision, recall and NDCG@k of best-first movie id lists against relevant sets."""
+    if not recommended:
+        return {'precision': 0.0, 'recall': 0.0, 'ndcg': 0.0}
+    hits = np.zeros((len(recommended), k), dtype=bool)
+    for row, (movie_ids, relevant_ids) in enumerate(zip(recommended, relevant)):
+        movie_ids = list(movie_ids)[:k]
+        hits[row, :len(movie_ids)] = [movie_id in relevant_ids for movie_id in movie_ids]
+    n_relevant = np.array([len(relevant_ids) for relevant_ids in relevant])
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    return {
+        'precision': float(hits.sum(axis=1).mean() / k),
+        'recall': float((hits.sum(axis=1) / n_relevant).mean()),
+        'ndcg': float((hits @ discounts / ideal).mean()),
+    }
+
+def _build_fold(position):
+    """Build one fold's rating models from its training ratings, in a forked worker."""
+    start = time.perf_counter()
+    fold, fold_dir = _eval_context['folds'][position], _eval_context['fold_dirs'][position]
+    user_item_matrix = UserItemMatrix.from_ratings(fold.train)
+    user_item_matrix.save(fold_dir / USER_ITEM_MATRIX_NAME)
+    PopularityModel.from_ratings(fold.train, _eval_context['movies_df']).save(fold_dir / POPULARITY_NAME)
+    CollaborativeFilter(user_item_matrix, cache_dir=fold_dir)
+    if _eval_context['matrix_factorization']:
+        MatrixFactorization(user_item_matrix, cache_dir=fold_dir)
+    return fold.name, time.perf_counter() - start
+
+class FoldModels:
+    """A fold's models memory-mapped from the artifacts :func:`_build_fold` wrote."""
+
+    def __init__(self, fold_dir, with_matrix_factorization):
+        self.user_item_matrix = UserItemMatrix.load(fold_dir / USER_ITEM_MATRIX_NAME)
+        self.popularity_model = PopularityModel.load(fold_dir / POPULARITY_NAME)
+        self.collaborative_filter = CollaborativeFilter(self.user_item_matrix, cache_dir=fold_dir, build=False)
+        self.matrix_factorization = None
+        if with_matrix_factorization:
+            self.matrix_factorization = MatrixFactorization(self.user_item_matrix, cache_dir=fold_dir, build=False)
+        self.raters_index = RatersIndex.from_user_item_matrix(self.user_item_matrix)
+        self.queries = None
+
+def _source_scorer(models, name, k, seed):
+    """Return a function scoring a batch of query positions with one source, watched movies removed."""
+    queries, content_filter = models.queries, _eval_context['content_filter']
+    # Same candidate depth as the hybrid recommender asks its sources for
+    depth = k * 3
+    rng = np.random.default_rng(seed)
+
+    def score(batch):
+        watched = [queries.watched[i] for i in batch]
+        if name == 'item_based':
+            ranked = models.collaborative_filter.item_based_scores(watched, depth)
+        elif name == 'user_based':
+            ranked = models.collaborative_filter.user_based_scores([queries.raters[i] for i in batch], depth, rng=rng)
+        elif name == 'content_based':
+            ranked = content_filter.get_scores(watched, depth)
+        elif name == 'matrix_factorization':
+            ranked = models.matrix_factorization.get_scores(watched, depth)
+        else:
+            ranked = [models.popularity_model.top(k + len(movie_ids)) for movie_ids in watched]
+        return [
+            np.asarray(movie_ids)[~np.isin(movie_ids, np.fromiter(seen, dtype=np.int64, count=len(seen)))][:k]
+            for (movie_ids, _), seen in zip(ranked, watched)
+        ]
+    return score
+
+def _hybrid_scorer(models, weights, k, seed, executor):
+    """Return a function scoring a batch of query positions through HybridRecommender."""
+    queries, movie_index = models.queries, _eval_context['movie_index']
+    recommender = HybridRecommender(_eval_context['movies_df'], _eval_context['content_filter'],
+                                    models.collaborative_filter, weights, result_cache=ResultCache(maxsize=0),
+                                    popularity_model=models.popularity_model, movie_index=movie_index,
+                                    executor=executor, matrix_factorization=models.matrix_factorization, rng=seed)
+    # Same check as a deployed weighting, so the sweep never reports weights the server would reject
+    recommender.validate_weights()
+
+    def score(batch):
+        results = recommender.get_recommendations_batch([
+            {'user_ids': queries.raters[i], 'watched_movies': queries.watched[i], 'top_n': k, 'weights': weights}
+            for i in batch
+        ])
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        # Served in sampling order as db_ids; back to movieIds to match the held-out ratings
+        return [movie_index.to_movie_ids([item['movieId'] for item in result]) for result in results]
+    return score
+
+def _evaluate(task):
+    """Score one fold with one configuration at one k, in a forked worker."""
+    position, config, k = task
+    models, args = _eval_context['fold_models'][position], _eval_context['args']
+    queries = models.queries
+    executor = None
+    if isinstance(config, str):
+        score = _source_scorer(models, config, k, args.seed)
+    else:
+        # Threads do not survive the fork, so every job starts its own source pool
+        executor = SourceExecutor('thread', timeout=None)
+        score = _hybrid_scorer(models, config, k, args.seed, executor)
+
+    batches = [range(start, min(start + args.batch_size, len(queries.user_ids)))
+               for start in range(0, len(queries.user_ids), args.batch_size)]
+    recommended, request_ms = [], []
+    for batch in batches:
+        start = time.perf_counter()
+        recommended.extend(score(batch))
+        request_ms.append((time.perf_counter() - start) * 1000 / len(batch))
+
+    peak_mb = None
+    if batches:
+        # Traced separately: tracemalloc slows the scoring down
+        tracemalloc.start()
+        try:
+            score(batches[0])
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    if executor is not None:
+        executor.shutdown()
+    return position, config, k, ranking_metrics(recommended, queries.relevant, k), request_ms, peak_mb
+
+def config_name(config):
+    if isinstance(config, str):
+        return config
+    return 'hybrid[' + ':'.join(f"{config[name]:g}" for name in HybridRecommender.SOURCES) + ']'
+
+def parse_weights(value, sources):
+    """Turn ``item:user:content[:mf]`` into a weights dict that sums to 1."""
+    values = [float(part) for part in value.split(':')]
+    if len(values) not in (3, 4) or abs(sum(values) - 1.0) > 1e-6:
+        raise argparse.ArgumentTypeError(f"weights must be 3 or 4 values summing to 1, got {value!r}")
+    weights = dict(zip(HybridRecommender.SOURCES, values + [0.0] * (4 - len(values))))
+    if any(weights[name] > 0 for name in HybridRecommender.SOURCES if name not in sources):
+        raise argparse.ArgumentTypeError(f"weights {value!r} use a source that is not evaluated")
+    return weights
+
+def weight_grid(step, sources):
+    """Every weighting of ``sources`` in multiples of ``step`` that sums to 1."""
+    units = round(1 / step)
+    grid = []
+    for split in itertools.product(range(units + 1), repeat=len(sources)):
+        if sum(split) == units:
+            weights = dict.fromkeys(HybridRecommender.SOURCES, 0.0)
+            weights.update({name: count / units for name, count in zip(sources, split)})
+            grid.append(weights)
+    return grid
+
+def summarize(fold_results, fold_names):
+    """Combine the folds of one configuration: metrics weighted by users, latency over all batches."""
+    users = np.array([fold_results[name]['users'] for name in fold_names], dtype=np.float64)
+    request_ms = np.concatenate([fold_results[name].pop('request_ms') for name in fold_names])
+    summary = {
+        metric: float(np.average([fold_results[name][metric] for name in fold_names], weights=users))
+        if users.sum() else 0.0
+        for metric in ('precision', 'recall', 'ndcg')
+    }
+    summary.update({
+        'users': int(users.sum()),
+        'mean_ms': float(request_ms.mean()) if len(request_ms) else None,
+        'p50_ms': float(np.percentile(request_ms, 50)) if len(request_ms) else None,
+        'p99_ms': float(np.percentile(request_ms, 99)) if len(request_ms) else None,
+        'peak_mb': max((fold_results[name]['peak_mb'] or 0.0) for name in fold_names),
+        'folds': fold_results,
+    })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate recommendation quality, latency and memory offline")
+    parser.add_argument('--movies', default=Config.MOVIES_PATH)
+    parser.add_argument('--ratings', default=Config.RATINGS_PATH)
+    parser.add_argument('--split', choices=['temporal', 'leave-k-out'], default='temporal')
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--test-fraction', type=float, default=0.1, help="ratings per temporal test window")
+    parser.add_argument('--holdout', type=int, default=5, help="ratings held out per user with leave-k-out")
+    parser.add_argument('--relevant-rating', type=float, default=4.0, help="held-out ratings that count as hits")
+    parser.add_argument('--max-users', type=int, default=1000, help="held-out users scored per fold")
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 20], help="list lengths (top_n) to evaluate")
+    parser.add_argument('--weights', action='append', default=[], help="item:user:content[:mf], repeatable")
+    parser.add_argument('--grid-step', type=float, help="also evaluate every weighting in steps of this size")
+    parser.add_argument('--matrix-factorization', action='store_true', help="also evaluate the ALS source")
+    parser.add_argument('--batch-size', type=int, default=32, help="users per scoring call")
+    parser.add_argument('--workers', type=int, default=Config.BUILD_WORKERS)
+    parser.add_argument('--target-ndcg', type=float, help="quality target for choosing a configuration")
+    parser.add_argument('--latency-budget-ms', type=float, help="p99 per-request latency budget")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results/evaluation.json')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sources = [name for name in SOURCES if name != 'matrix_factorization' or args.matrix_factorization]
+    hybrid_sources = [name for name in HybridRecommender.SOURCES if name in sources]
+    try:
+        grid = [parse_weights(value, sources) for value in args.weights]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.grid_step:
+        grid += weight_grid(args.grid_step, hybrid_sources)
+    if not grid:
+        grid = [{**dict.fromkeys(HybridRecommender.SOURCES, 0.0), **Config.WEIGHTS}]
+    configs = sources + grid
+
+    loader = DataLoader(args.movies, args.ratings)
+    movies_df = loader.load_movies()
+    ratings_df = read_table(args.ratings, {**RATING_DTYPES, 'timestamp': 'int64'} if args.split == 'temporal'
+                            else RATING_DTYPES)
+    if args.split == 'temporal':
+        folds = temporal_splits(ratings_df, args.folds, args.test_fraction)
+    else:
+        folds = leave_k_out_splits(ratings_df, args.folds, args.holdout, args.seed)
+    print(f"{len(folds)} {args.split} folds over {len(ratings_df)} ratings, {len(configs)} configurations")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fold_dirs = [Path(tmp) / f"fold-{i}" for i in range(len(folds))]
+        _eval_context.update(folds=folds, fold_dirs=fold_dirs, movies_df=movies_df, args=args,
+                             movie_index=loader.movie_index, matrix_factorization=args.matrix_factorization)
+        try:
+            context = multiprocessing.get_context('fork')
+            # Content models depend on the movies only and are shared by every fold
+            ContentBasedFilter(movies_df, cache_dir=Path(tmp) / 'content')
+            with ProcessPoolExecutor(max_workers=max(min(args.workers, len(folds)), 1), mp_context=context) as pool:
+                build_seconds = dict(pool.map(_build_fold, range(len(folds))))
+
+            # Memory-mapped here, before the workers fork, so they all read the same pages
+            _eval_context['content_filter'] = ContentBasedFilter(movies_df, cache_dir=Path(tmp) / 'content',
+                                                                 build=False)
+            rng = np.random.default_rng(args.seed)
+            fold_models = []
+            for fold, fold_dir in zip(folds, fold_dirs):
+                models = FoldModels(fold_dir, args.matrix_factorization)
+                models.queries = build_queries(fold, models.raters_index, args.relevant_rating, args.max_users, rng)
+                fold_models.append(models)
+            _eval_context['fold_models'] = fold_models
+
+            tasks = [(position, config, k) for position in range(len(folds)) for config in configs for k in args.k]
+            fold_results = {}
+            with ProcessPoolExecutor(max_workers=max(args.workers, 1), mp_context=context) as pool:
+                for position, config, k, metrics, request_ms, peak_mb in pool.map(_evaluate, tasks):
+                    fold_results.setdefault((config_name(config), k), {})[folds[position].name] = {
+                        **metrics, 'users': len(fold_models[position].queries.user_ids),
+                        'request_ms': np.asarray(request_ms), 'peak_mb': peak_mb,
+                    }
+        finally:
+            _eval_context.clear()
+
+    fold_names = [fold.name for fold in folds]
+    deployable = {config_name(config) for config in grid}
+    results = {f"{name}@{k}": {**summarize(by_fold, fold_names), 'deployable': name in deployable}
+               for (name, k), by_fold in fold_results.items()}
+    results['build_seconds'] = build_seconds
+
+    print(f"  {'configuration':36s} {'prec':>7s} {'recall':>7s} {'ndcg':>7s} {'mean ms':>9s} {'p99 ms':>9s}"
+          f" {'peak MB':>8s} {'deploy':>6s}")
+    ranked = sorted((name for name in results if name != 'build_seconds'), key=lambda name: -results[name]['ndcg'])
+    for name in ranked:
+        row = results[name]
+        print(f"  {name:36s} {row['precision']:7.4f} {row['recall']:7.4f} {row['ndcg']:7.4f}"
+              f" {row['mean_ms'] or 0:9.2f} {row['p99_ms'] or 0:9.2f} {row['peak_mb']:8.1f}"
+              f" {'yes' if row['deployable'] else 'no':>6s}")
+
+    if args.target_ndcg is not None or args.latency_budget_ms is not None:
+        eligible = [name for name in ranked if results[name]['deployable']
+                    and (args.target_ndcg is None or results[name]['ndcg'] >= args.target_ndcg)
+                    and (args.latency_budget_ms is None or (results[name]['p99_ms'] or 0) <= args.latency_budget_ms)]
+        # Ranked by NDCG, so the first eligible configuration is the best one within budget
+        print(f"Best deployable configuration within target and budget: {eligible[0]}" if eligible
+              else "No deployable configuration meets both the quality target and the latency budget")
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    params['config'] = {'neighbour_k': Config.NEIGHBOUR_K, 'fusion': Config.FUSION_METHOD}
+    write_results(args.output, 'evaluation', params, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Closed-loop load generator for POST /recommend/group.
+
+    python -m benchmarks.load_test --url http://localhost:8082/recommend/group \
+        [--concurrency 16] [--duration 30] [--group-size 3] [--output results.json]
+
+Start the server first (``python api.py`` or ``uvicorn asgi:app``). Each of the
+``--concurrency`` workers sends its next request as soon as the previous one returns;
+request bodies are random groups drawn from the db_ids of ``--movies``. Reports p50/p99
+latency and throughput, after a warm-up period that is not counted.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from benchmarks.common import latency_stats, write_results
+from config import Config
+from services.data_loader import MOVIE_DTYPES, read_table
+
+def make_bodies(db_ids, n, group_size, watched, top_n, seed):
+    """Pre-build request bodies so the generator spends no time on them while measuring."""
+    rng = np.random.default_rng(seed)
+    return [
+        json.dumps({
+            'watched_movies': [rng.choice(db_ids, watched, replace=False).tolist() for _ in range(group_size)],
+            'top_n': top_n,
+        }).encode()
+        for _ in range(n)
+    ]
+
+def worker(url, bodies, offset, deadline, warmup_until, latencies, errors, lock):
+    i = offset
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(url, data=bodies[i % len(bodies)], method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+            failed = False
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            failed = True
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if start >= warmup_until:
+            with lock:
+                if failed:
+                    errors[0] += 1
+                else:
+                    latencies.append(elapsed_ms)
+        i += 1
+
+def run(url, bodies, concurrency, duration, warmup):
+    latencies, errors, lock = [], [0], threading.Lock()
+    start = time.perf_counter()
+    warmup_until, deadline = start + warmup, start + warmup + duration
+    threads = [
+        threading.Thread(target=worker, args=(url, bodies, n * 7919, deadline, warmup_until, latencies, errors, lock))
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency_stats(latencies, duration, errors[0])
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /recommend/group endpoint")
+    parser.add_argument('--url', default='http://localhost:8082/recommend/group')
+    parser.add_argument('--movies', default=Config.MOVIES_PATH, help="movie table to draw db_ids from")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=20.0, help="measured seconds per concurrency level")
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--group-size', type=int, default=3)
+    parser.add_argument('--watched', type=int, default=10, help="watched movies per group member")
+    parser.add_argument('--top-n', type=int, default=20)
+    parser.add_argument('--distinct-requests', type=int, default=1000,
+                        help="distinct bodies cycled through; lower values exercise the result cache")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results/load_test.json')
+    args = parser.parse_args()
+
+    db_ids = read_table(args.movies, MOVIE_DTYPES)['db_id'].dropna().astype(int).unique()
+    bodies = make_bodies(db_ids, args.distinct_requests, args.group_size, args.watched, args.top_n, args.seed)
+
+    results = {}
+    for concurrency in args.concurrency:
+        stats = run(args.url, bodies, concurrency, args.duration, args.warmup)
+        results[f"concurrency_{concurrency}"] = stats
+        print(f"concurrency {concurrency:4d}: {stats['throughput_rps']:8.1f} req/s  "
+              f"p50 {stats.get('p50_ms', float('nan')):8.1f} ms  p99 {stats.get('p99_ms', float('nan')):8.1f} ms  "
+              f"errors {stats['errors']}")
+
+    write_results(args.output, 'load_test', {k: v for k, v in vars(args).items() if k != 'output'}, results)
+
+if __name__ == '__main__':
+    main()
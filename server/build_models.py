@@ -0,0 +1,28 @@
+"""Build all model artifacts offline and publish them as a new version.
+
+    python build_models.py [--movies PATH] [--ratings PATH] [--artifacts-dir DIR]
+                           [--workers N] [--full] [--keep N]
+
+The API only loads the version published here and refuses to start without one.
+"""
+import argparse
+import logging
+from config import Config
+from services.pipeline import build_version
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and publish recommendation model artifacts")
+    parser.add_argument('--movies', default=Config.MOVIES_PATH, help="movies CSV")
+    parser.add_argument('--ratings', default=Config.RATINGS_PATH, help="ratings CSV")
+    parser.add_argument('--artifacts-dir', default=Config.ARTIFACTS_DIR, help="root of the versioned artifacts")
+    parser.add_argument('--workers', type=int, default=Config.BUILD_WORKERS, help="parallel model stages")
+    parser.add_argument('--full', action='store_true', help="rebuild everything instead of reusing fresh artifacts")
+    parser.add_argument('--keep', type=int, default=Config.ARTIFACTS_KEEP, help="published versions to keep")
+    args = parser.parse_args()
+
+    version_dir = build_version(args.movies, args.ratings, args.artifacts_dir,
+                                workers=args.workers, reuse=not args.full, keep=args.keep)
+    logging.info(f"Artifacts published to {version_dir}")
+
+if __name__ == '__main__':
+    main()
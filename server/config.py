@@ -1,18 +1,114 @@
 # Configuration settings for the movie recommendation system
 import os
 
+def _data_path(base_dir, name):
+    """Prefer the Parquet output of prepare_data.py, falling back to the CSV of the same name."""
+    parquet_path = os.path.join(base_dir, f'{name}.parquet')
+    return parquet_path if os.path.exists(parquet_path) else os.path.join(base_dir, f'{name}.csv')
+
 class Config:
-    # File paths
+    # File paths: CSV files, or Parquet files / directories of parts written by prepare_data.py
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    MOVIES_PATH = os.path.join(BASE_DIR, 'movies_large_updated.csv')
-    RATINGS_PATH = os.path.join(BASE_DIR, 'ratings_large_updated.csv')
+    MOVIES_PATH = os.environ.get('RECOMMENDER_MOVIES', _data_path(BASE_DIR, 'movies_large_updated'))
+    RATINGS_PATH = os.environ.get('RECOMMENDER_RATINGS', _data_path(BASE_DIR, 'ratings_large_updated'))
+
+    # Versioned model artifacts published by build_models.py; the API serves the CURRENT one
+    ARTIFACTS_DIR = os.environ.get('RECOMMENDER_ARTIFACTS', os.path.join(BASE_DIR, 'artifacts'))
+    ARTIFACTS_KEEP = 3  # published versions kept on disk
+    BUILD_WORKERS = os.cpu_count() or 1
+
+    # Model cache; artifacts are rebuilt when their input fingerprint or parameters change
+    CACHE_DIR = 'cache'
+    # Also hash input file contents instead of relying on size and mtime only
+    CACHE_CONTENT_HASH = False
     
     # Weights for hybrid filtering
     WEIGHTS = {
         'item_based': 0.2,
         'user_based': 0.2,
-        'content_based': 0.6
+        'content_based': 0.6,
+        'matrix_factorization': 0.0
     }
     
     # Default number of recommendations
-    DEFAULT_TOP_N = 50
\ No newline at end of file
+    DEFAULT_TOP_N = 50
+
+    # How /recommend/group combines its members when the request does not say: 'union' merges
+    # their histories into one, as the endpoint always has; 'average', 'least_misery',
+    # 'most_pleasure' and 'fairness' score members separately and are opt-in per request
+    GROUP_AGGREGATION = 'union'
+
+    # Fusion of the sources' ranked lists: 'weighted' (normalized scores) or 'rrf' (reciprocal rank)
+    FUSION_METHOD = 'weighted'
+    FUSION_RRF_K = 60
+    # Seed of the recommendation sampling RNG; unset draws a fresh seed per process
+    RANDOM_SEED = int(os.environ['RECOMMENDER_SEED']) if os.environ.get('RECOMMENDER_SEED') else None
+
+    # Cold-start popularity: movies need this quantile of rating counts to weigh in fully
+    POPULARITY_MIN_VOTES_QUANTILE = 0.75
+
+    # Long-lived pool running the recommendation sources: 'thread' or 'process'
+    EXECUTOR_TYPE = os.environ.get('RECOMMENDER_EXECUTOR', 'thread')
+    EXECUTOR_WORKERS = int(os.environ.get('RECOMMENDER_EXECUTOR_WORKERS', 4))
+    # Seconds a request waits for a source before serving from the others
+    SOURCE_TIMEOUT = 2.0
+
+    # ASGI micro-batching of concurrent /recommend/group requests
+    BATCH_MAX_SIZE = 32
+    BATCH_MAX_WAIT = 0.005  # seconds
+
+    # Request-level cache of candidate pools in front of HybridRecommender
+    RESULT_CACHE_SIZE = 1024
+    RESULT_CACHE_TTL = 300  # seconds
+
+    # Startup: the API module imports quickly and loads the models in a background thread.
+    # Sources load on first use, or all at once right after startup with WARM_UP
+    WARM_UP = os.environ.get('RECOMMENDER_WARM_UP', '1') == '1'
+    # Seconds a request waits for the models to load before it is answered with 503
+    MODEL_WAIT_TIMEOUT = 10.0
+
+    # Nearest-neighbour similarity index
+    NEIGHBOUR_K = 100
+    # Memory for one dense block of similarities; rows per block = budget // (rows * 4 bytes)
+    NEIGHBOUR_BLOCK_BYTES = 128 * 2**20
+    # Rows recomputed per block when ratings are ingested incrementally (also capped by the budget)
+    NEIGHBOUR_UPDATE_BLOCK_SIZE = 64
+
+    # Content engine: catalogs below CONTENT_ANN_MIN_ITEMS use the exact neighbour index,
+    # larger ones an LSH index over TF-IDF vectors reduced to CONTENT_SVD_COMPONENTS
+    # dimensions (0 keeps the sparse vectors)
+    CONTENT_ANN_MIN_ITEMS = 20000
+    CONTENT_SVD_COMPONENTS = 128
+    CONTENT_ANN_TABLES = 16
+    # Hash bits grow with the catalog so each bucket holds about this many movies
+    CONTENT_ANN_BUCKET_SIZE = 256
+    # Recall vs latency: neighbouring buckets probed per table on top of the home bucket
+    CONTENT_ANN_PROBES = 2
+
+    # Matrix factorization (ALS) source; trained by build_models.py and served only when enabled
+    MF_ENABLED = os.environ.get('RECOMMENDER_MF', '0') == '1'
+    MF_FACTORS = 64
+    MF_REGULARIZATION = 0.05
+    MF_ITERATIONS = 10
+    MF_BLOCK_SIZE = 1024
+    # Memory for the factor rows gathered at once to build Gram matrices
+    MF_GATHER_BYTES = 64 * 2**20
+    MF_THREADS = os.cpu_count() or 1
+
+    # User-based filtering: neighbours per seed user and cap on sampled seed users
+    USER_BASED_NEIGHBOURS = 10
+    USER_BASED_MAX_SEED_USERS = 500
+
+    # Operational log of the API (errors, warnings, model loading)
+    LOG_PATH = os.environ.get('RECOMMENDER_LOG', 'app.log')
+    # Request logging: a sample of request payloads plus every slow request, written off the request thread
+    REQUEST_LOG_PATH = os.environ.get('RECOMMENDER_REQUEST_LOG', LOG_PATH)
+    REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('RECOMMENDER_REQUEST_LOG_SAMPLE_RATE', 0.01))
+    REQUEST_LOG_SLOW_SECONDS = 1.0
+
+    # serve.py: pre-forked workers sharing one copy of the models; CURRENT is polled for new versions
+    SERVE_WORKERS = int(os.environ.get('RECOMMENDER_WORKERS', os.cpu_count() or 1))
+    SERVE_RELOAD_INTERVAL = 5.0
+    # Seconds new workers get to start before a reload is abandoned, and old ones to drain
+    SERVE_READY_TIMEOUT = 30.0
+    SERVE_GRACEFUL_TIMEOUT = 30.0
@@ -0,0 +1,221 @@
+"""Streaming preparation of the MovieLens dump for the recommender.
+
+    python prepare_data.py movies  [--input movies_large.csv] [--output movies_large_updated.parquet]
+    python prepare_data.py ratings [--movies movies_large_updated.parquet] [--input ratings_large.csv]
+                                   [--output ratings_large_updated.parquet] [--keep-probability 0.03]
+
+``movies`` matches MovieLens titles to movie-service ids (db_id) and keeps matched movies.
+``ratings`` streams the ratings in chunks, keeps ratings of movies that have a db_id and
+samples users by a deterministic hash of userId, writing one Parquet part per chunk.
+An interrupted ``ratings`` run resumes after the last completed chunk.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from services.artifacts import file_fingerprint
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+PROGRESS_NAME = '_progress.json'
+RATINGS_DTYPES = {'userId': 'int32', 'movieId': 'int32', 'rating': 'float32', 'timestamp': 'int64'}
+
+def read_table(path, columns=None):
+    """Read a CSV or Parquet table, chosen by extension."""
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def write_table(df, path):
+    """Write a CSV or Parquet table, chosen by extension, replacing ``path`` atomically."""
+    # Dot-prefixed so Parquet dataset readers skip a leftover from an interrupted run
+    tmp_path = Path(path).with_name(f".{Path(path).name}.tmp-{os.getpid()}")
+    if str(path).endswith('.parquet'):
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def normalize_titles(names):
+    """Vectorized title normalization: lowercase, alphanumerics only, single spaces."""
+    return (names.str.lower()
+            .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip())
+
+def fetch_db_movies(dbname, user, password, host, port, limit):
+    """Load (id, en_name, year) of the best-rated movies of the movie-service database."""
+    import psycopg2
+
+    conn = psycopg2.connect(dbname=dbname, user=user, password=password, host=host, port=port)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, en_name, year
+                FROM movies
+                WHERE en_name IS NOT NULL AND year IS NOT NULL
+                ORDER BY imdb_rating DESC, kp_rating DESC
+                LIMIT %s
+            """, (limit,))
+            return pd.DataFrame(cursor.fetchall(), columns=['db_id', 'en_name', 'year'])
+    finally:
+        conn.close()
+
+def prepare_movies(args):
+    movies = pd.read_csv(args.input)
+    db_movies = fetch_db_movies(args.db_name, args.db_user, args.db_password, args.db_host, args.db_port,
+                                args.db_limit)
+
+    # (нормализованное название, год) -> id; при дубликатах побеждает последняя строка, как в прежнем словаре
+    db_movies['name'] = normalize_titles(db_movies['en_name'])
+    db_movies['year'] = db_movies['year'].astype('Int64')
+    mapping = db_movies.drop_duplicates(subset=['name', 'year'], keep='last')[['name', 'year', 'db_id']]
+
+    parts = movies['title'].str.extract(r'(.+?)\s*\((\d{4})\)')
+    movies['name'] = normalize_titles(parts[0].str.strip().fillna(movies['title']))
+    movies['year'] = pd.to_numeric(parts[1], errors='coerce').astype('Int64')
+    matched = movies.merge(mapping, on=['name', 'year'], how='left')
+
+    unmatched = matched['db_id'].isna()
+    for title in matched.loc[unmatched, 'title']:
+        logging.debug(f"Не найдено: {title}")
+    result = matched.loc[~unmatched].drop(columns=['name', 'year'])
+    result['db_id'] = result['db_id'].astype('int32')
+    write_table(result, args.output)
+
+    print(f"Всего записей: {len(movies)}")
+    print(f"Совпадений: {len(result)}")
+    print(f"Без совпадений (удалено): {unmatched.sum()}")
+
+def read_csv_chunks(path, chunk_size, dtype, offset=0):
+    """Yield ``(chunk, offset)`` for every ``chunk_size`` rows of a CSV file.
+
+    ``offset`` is the byte position right after the chunk. Passing a saved offset back in
+    seeks straight past the completed chunks, so a resumed run neither reads nor parses them.
+    """
+    with open(path, 'rb') as f:
+        names = f.readline().decode().strip().split(',')
+        if offset:
+            f.seek(offset)
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield pd.read_csv(io.BytesIO(b''.join(lines)), header=None, names=names, dtype=dtype), f.tell()
+
+def user_sample_mask(user_ids, keep_probability, seed=0):
+    """Keep a user iff a SplitMix64 hash of (userId, seed) falls below ``keep_probability``.
+
+    The decision depends on the userId alone, so all ratings of a user are kept or dropped
+    together no matter which chunk they are in, and reruns pick the same users.
+    """
+    with np.errstate(over='ignore'):
+        z = np.asarray(user_ids, dtype=np.uint64) + np.uint64(seed) * np.uint64(0xD1B54A32D192ED03)
+        z += np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53 < keep_probability
+
+def load_progress(output_dir, expected):
+    """Return the saved progress if it belongs to the same input and parameters."""
+    progress_path = output_dir / PROGRESS_NAME
+    if not progress_path.exists():
+        return None
+    with open(progress_path) as f:
+        progress = json.load(f)
+    if progress.get('input') != expected['input'] or progress.get('params') != expected['params']:
+        logging.info("Input or parameters changed since the last run, starting over")
+        return None
+    if 'offset' not in progress:
+        logging.info("Progress was saved without a resume offset, starting over")
+        return None
+    return progress
+
+def save_progress(output_dir, progress):
+    tmp_path = output_dir / f"{PROGRESS_NAME}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp_path, output_dir / PROGRESS_NAME)
+
+def prepare_ratings(args):
+    movies = read_table(args.movies, columns=['movieId', 'db_id'])
+    valid_movie_ids = np.unique(movies.loc[movies['db_id'].notna(), 'movieId'].to_numpy(dtype=np.int32))
+
+    output_dir = Path(args.output)
+    params = {'chunk_size': args.chunk_size, 'keep_probability': args.keep_probability, 'seed': args.seed,
+              'movies': file_fingerprint(args.movies) if Path(args.movies).is_file() else str(args.movies)}
+    fresh = {'input': file_fingerprint(args.input), 'params': params,
+             'chunks_done': 0, 'offset': 0, 'total': 0, 'matched': 0, 'kept': 0, 'complete': False}
+    progress = load_progress(output_dir, fresh)
+    if progress is None:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        output_dir.mkdir(parents=True)
+        progress = fresh
+    elif progress['complete']:
+        logging.info(f"{output_dir} is already complete")
+    else:
+        logging.info(f"Resuming after chunk {progress['chunks_done']}")
+
+    if not progress['complete']:
+        # Completed chunks are skipped by seeking to the byte offset saved after the last one
+        reader = read_csv_chunks(args.input, args.chunk_size, RATINGS_DTYPES, progress['offset'])
+        for chunk_index, (chunk, offset) in enumerate(reader, start=progress['chunks_done']):
+            matched = chunk[np.isin(chunk['movieId'].to_numpy(), valid_movie_ids)]
+            kept = matched[user_sample_mask(matched['userId'].to_numpy(), args.keep_probability, args.seed)]
+            write_table(kept, output_dir / f"part-{chunk_index:05d}.parquet")
+
+            progress['chunks_done'] = chunk_index + 1
+            progress['offset'] = offset
+            progress['total'] += len(chunk)
+            progress['matched'] += len(matched)
+            progress['kept'] += len(kept)
+            save_progress(output_dir, progress)
+            logging.info(f"Chunk {chunk_index}: {len(chunk)} rows, kept {len(kept)}")
+
+        progress['complete'] = True
+        save_progress(output_dir, progress)
+
+    kept_users = pd.read_parquet(output_dir, columns=['userId'])['userId'].nunique()
+    print(f"Всего транзакций: {progress['total']}")
+    print(f"Совпадающих транзакций: {progress['matched']}")
+    print(f"Оставлено транзакций: {progress['kept']}")
+    print(f"Удалено транзакций: {progress['matched'] - progress['kept']}")
+    print(f"Оставлено пользователей: {kept_users}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare movies and ratings for the recommender")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    movies = commands.add_parser('movies', help="match movies to movie-service ids")
+    movies.add_argument('--input', default='movies_large.csv')
+    movies.add_argument('--output', default='movies_large_updated.parquet')
+    movies.add_argument('--db-name', default='movie-service-db')
+    movies.add_argument('--db-user', default='postgres')
+    movies.add_argument('--db-password', default='postgres')
+    movies.add_argument('--db-host', default='localhost')
+    movies.add_argument('--db-port', default='5433')
+    movies.add_argument('--db-limit', type=int, default=13000)
+
+    ratings = commands.add_parser('ratings', help="filter and sample ratings of matched movies")
+    ratings.add_argument('--movies', default='movies_large_updated.parquet')
+    ratings.add_argument('--input', default='ratings_large.csv')
+    ratings.add_argument('--output', default='ratings_large_updated.parquet', help="output directory of parts")
+    ratings.add_argument('--keep-probability', type=float, default=0.03)
+    ratings.add_argument('--seed', type=int, default=0)
+    ratings.add_argument('--chunk-size', type=int, default=1_000_000)
+
+    args = parser.parse_args()
+    if args.command == 'movies':
+        prepare_movies(args)
+    else:
+        prepare_ratings(args)
+
+if __name__ == '__main__':
+    main()
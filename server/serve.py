@@ -0,0 +1,260 @@
+"""Production entry point: pre-forked ASGI workers sharing one copy of the models.
+
+    python serve.py [--host HOST] [--port PORT] [--workers N] [--reload-interval SECONDS]
+
+The parent process loads the published artifacts version once and forks the workers,
+which serve ``asgi.app`` on a listening socket they all inherit. The large arrays are
+memory-mapped read-only from the artifact files, so every worker reads the same page
+cache pages, and what the parent built on the heap is shared copy-on-write; an added
+worker costs little more than its own interpreter state.
+
+The parent polls ``CURRENT`` (or reloads at once on SIGHUP). When a new version is
+published it loads it, forks a new generation of workers on the same socket, waits
+until they accept connections and only then stops the old generation gracefully, so
+requests are served throughout. A version that fails to load is skipped and the old
+workers keep serving. SIGTERM or SIGINT stops everything.
+
+POST /ratings is rejected with 409: ingested ratings would only reach the worker that
+received them and be dropped at the next reload, so model updates go through
+build_models.py instead.
+"""
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import time
+from config import Config
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+def create_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def run_worker(sock, ready_fd=None):
+    """Body of a forked worker: serve the ASGI app on the inherited socket until told to stop.
+
+    Once it accepts connections the worker writes a byte to ``ready_fd``, if given.
+    """
+    import uvicorn
+    import api
+    import asgi
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+
+    parent = os.getppid()
+
+    class WorkerServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if ready_fd is not None:
+                os.write(ready_fd, b'1')
+                os.close(ready_fd)
+
+        async def on_tick(self, counter):
+            # Orphaned workers stop instead of serving on without supervision
+            return await super().on_tick(counter) or os.getppid() != parent
+
+    config = uvicorn.Config(asgi.app, lifespan='off', timeout_graceful_shutdown=Config.SERVE_GRACEFUL_TIMEOUT)
+    WorkerServer(config).run(sockets=[sock])
+    # The worker leaves through os._exit, which skips atexit handlers
+    api.request_log.close()
+
+class Master:
+    """Forks, supervises and rolls over the worker processes."""
+
+    def __init__(self, sock, workers, reload_interval):
+        self.sock = sock
+        self.n_workers = workers
+        self.reload_interval = reload_interval
+        self.workers = {}  # pid -> version served
+        self.version = None
+        self.failed_version = None
+        self.should_exit = False
+        self.reload_requested = False
+
+    def load(self, version_dir):
+        """Load a version into this process so the workers forked next inherit it."""
+        import api
+        from services.pipeline import PublishedModels
+
+        # Workers are forked with every source loaded, and a version with a broken source is not served
+        published = PublishedModels(version_dir).warm_up(wait=True)
+        # Objects frozen for the previous generation must be collectable again
+        gc.unfreeze()
+        api.load_models(published)
+        self.version = version_dir.name
+        self._freeze()
+
+    @staticmethod
+    def _freeze():
+        gc.collect()
+        # Keep the collector from writing to the pages the workers share copy-on-write
+        gc.freeze()
+
+    def spawn(self, notify_ready=True):
+        """Fork one worker for the current version; return its pid and, if asked, its readiness pipe."""
+        read_fd, write_fd = os.pipe() if notify_ready else (None, None)
+        pid = os.fork()
+        if pid == 0:
+            if read_fd is not None:
+                os.close(read_fd)
+            try:
+                run_worker(self.sock, write_fd)
+                status = 0
+            except BaseException:
+                logging.exception("Worker crashed")
+                status = 1
+            os._exit(status)
+        if write_fd is not None:
+            os.close(write_fd)
+        self.workers[pid] = self.version
+        return pid, read_fd
+
+    def spawn_generation(self, timeout=Config.SERVE_READY_TIMEOUT):
+        """Fork a full set of workers and wait until every one of them is ready.
+
+        Returns False, after stopping them, if any did not start in time.
+        """
+        pending = dict(self.spawn() for _ in range(self.n_workers))
+        pids = list(pending)
+        deadline = time.monotonic() + timeout
+        failed = False
+        while pending and not failed and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending.values()), [], [], max(deadline - time.monotonic(), 0))
+            for pid, fd in list(pending.items()):
+                if fd in readable:
+                    # EOF instead of the ready byte: the worker died during startup
+                    failed = failed or not os.read(fd, 1)
+                    os.close(fd)
+                    del pending[pid]
+
+        if pending or failed:
+            for fd in pending.values():
+                os.close(fd)
+            self.stop([pid for pid in pids if pid in self.workers])
+            return False
+        logging.info(f"Started {len(pids)} workers for version {self.version}")
+        return True
+
+    def stop(self, pids, sig=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        """Collect exited workers and replace those of the version being served."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            version = self.workers.pop(pid, None)
+            if version == self.version and not self.should_exit:
+                logging.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, "
+                                f"restarting it")
+                self.spawn(notify_ready=False)
+
+    def reload(self, force=False):
+        """Roll the workers over to the published version if it changed.
+
+        A version that failed before is only retried when ``force`` (SIGHUP) is set.
+        """
+        from services.artifacts import current_version_dir
+
+        try:
+            version_dir = current_version_dir(Config.ARTIFACTS_DIR)
+        except FileNotFoundError as e:
+            logging.error(f"Cannot reload: {e}")
+            return
+        if version_dir.name == self.version or (version_dir.name == self.failed_version and not force):
+            return
+
+        old_version, old_pids = self.version, list(self.workers)
+        logging.info(f"Version {version_dir.name} published, reloading from {old_version}")
+        try:
+            self.load(version_dir)
+        except Exception as e:
+            logging.error(f"Failed to load version {version_dir.name}, still serving {old_version}: {e}")
+            self.failed_version = version_dir.name
+            return
+        if not self.spawn_generation():
+            logging.error(f"Workers for version {version_dir.name} did not start, still serving {old_version}")
+            self.failed_version = version_dir.name
+            # Workers restarted from now on must serve the old version again
+            self.load(version_dir.with_name(old_version))
+            return
+        # The new generation already accepts connections; the old one drains its requests and exits
+        self.stop(old_pids)
+
+    def run(self):
+        # Importing the app starts loading the current version; the workers inherit everything loaded here
+        import api
+        import asgi
+
+        # Fork only once the models and every source are loaded: the loader threads do not survive a fork
+        api.require_models(timeout=None)
+        api.models.warm_up(wait=True)
+        api.ingestion_disabled = ("Ratings cannot be ingested by serve.py workers: each worker has its own "
+                                  "copy of the models and reloads drop it; publish with build_models.py")
+
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        self.version = api.models.version_dir.name
+        self._freeze()
+        if not self.spawn_generation():
+            raise RuntimeError("Workers failed to start")
+
+        next_check = time.monotonic() + self.reload_interval
+        while not self.should_exit:
+            time.sleep(0.2)
+            self.reap()
+            if self.reload_requested or time.monotonic() >= next_check:
+                self.reload(force=self.reload_requested)
+                self.reload_requested = False
+                next_check = time.monotonic() + self.reload_interval
+
+        logging.info("Shutting down workers")
+        self.stop(list(self.workers))
+        deadline = time.monotonic() + Config.SERVE_GRACEFUL_TIMEOUT
+        while self.workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+            self.reap()
+        self.stop(list(self.workers), signal.SIGKILL)
+
+    def _handle_exit(self, signum, frame):
+        self.should_exit = True
+
+    def _handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recommendations from pre-forked workers")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--workers', type=int, default=Config.SERVE_WORKERS)
+    parser.add_argument('--reload-interval', type=float, default=Config.SERVE_RELOAD_INTERVAL,
+                        help="seconds between checks for a newly published version")
+    args = parser.parse_args()
+    if Config.EXECUTOR_TYPE != 'thread':
+        # Forking a source pool in the parent would leave every worker with a dead copy of it
+        parser.error("serve.py already runs one process per worker; use RECOMMENDER_EXECUTOR=thread")
+
+    Master(create_socket(args.host, args.port), args.workers, args.reload_interval).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import numpy as np
+from scipy import sparse
+from config import Config
+from services.artifacts import arrays_to_sparse, load_artifact, save_artifact, sparse_to_arrays
+from services.scoring import normalize_rows
+from services.user_item_matrix import lookup_positions
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+def reduce_dimensions(matrix, n_components=Config.CONTENT_SVD_COMPONENTS, seed=0):
+    """Project a sparse matrix onto its top singular directions as L2-normalized float32 rows.
+
+    With ``n_components`` of 0, or when the matrix has too few columns to reduce, the rows
+    are only normalized and stay sparse.
+    """
+    n_components = min(n_components, matrix.shape[1] - 1)
+    if n_components <= 0:
+        return normalize_rows(sparse.csr_matrix(matrix, dtype=np.float32))
+    # Build-time only; scikit-learn is slow to import and never needed to serve
+    from sklearn.decomposition import TruncatedSVD
+
+    svd = TruncatedSVD(n_components=n_components, random_state=seed)
+    embeddings = svd.fit_transform(matrix).astype(np.float32)
+    logging.info(f"Reduced {matrix.shape[1]} features to {n_components} dimensions, "
+                 f"explained variance {svd.explained_variance_ratio_.sum():.2f}")
+    return normalize_rows(embeddings)
+
+class LshIndex:
+    """Approximate cosine search over row vectors with random-projection LSH.
+
+    Every table hashes a vector to the sign pattern of ``n_bits`` random hyperplanes;
+    ``codes[t]`` holds the bucket code of every row in table t, sorted, and ``order[t]``
+    the matching row positions, so a bucket is a contiguous slice found by binary search.
+    Candidates from the probed buckets are re-ranked by their exact cosine. ``vectors``
+    are L2-normalized rows, either dense float32 embeddings or a sparse matrix.
+    """
+    # Queries scored together by one matrix product in exact search
+    QUERY_BLOCK_SIZE = 64
+
+    def __init__(self, ids, vectors, planes, codes, order, sorter=None):
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.vectors = vectors
+        self.planes = np.asarray(planes, dtype=np.float32)
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.order = np.asarray(order, dtype=np.int32)
+        self._sorter = np.argsort(self.ids, kind='stable') if sorter is None else np.asarray(sorter)
+        self._bit_values = np.left_shift(np.int64(1), np.arange(self.planes.shape[1], dtype=np.int64))
+
+    @classmethod
+    def build(cls, vectors, ids, n_tables=Config.CONTENT_ANN_TABLES, n_bits=None,
+              bucket_size=Config.CONTENT_ANN_BUCKET_SIZE, seed=0):
+        """Hash every row of ``vectors`` into ``n_tables`` tables of ``n_bits``-bit buckets.
+
+        By default ``n_bits`` grows with the catalog so a bucket holds about ``bucket_size`` rows.
+        """
+        if n_bits is None:
+            n_bits = int(np.clip(np.round(np.log2(max(vectors.shape[0], 1) / bucket_size)), 1, 62))
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((n_tables, n_bits, vectors.shape[1])).astype(np.float32)
+        index = cls(ids, vectors, planes, np.empty((n_tables, 0)), np.empty((n_tables, 0)))
+
+        codes = index._hash(vectors)
+        order = np.argsort(codes, axis=1, kind='stable').astype(np.int32)
+        index.codes = np.take_along_axis(codes, order, axis=1)
+        index.order = order
+        logging.info(f"LSH index built: {vectors.shape[0]} rows, {n_tables} tables of {n_bits} bits")
+        return index
+
+    def _project(self, vectors):
+        """Return the (n_rows, n_tables, n_bits) projections of ``vectors`` on the hyperplanes."""
+        n_tables, n_bits, dim = self.planes.shape
+        projections = vectors @ self.planes.reshape(-1, dim).T
+        return np.asarray(projections, dtype=np.float32).reshape(-1, n_tables, n_bits)
+
+    def _hash(self, vectors):
+        """Return the (n_tables, n_rows) bucket codes of ``vectors``."""
+        return ((self._project(vectors) > 0) @ self._bit_values).T
+
+    def _probe_codes(self, queries, n_probes):
+        """Bucket codes to visit per query and table: the home bucket, then the ``n_probes``
+        neighbouring buckets reached by flipping the least certain bits one at a time."""
+        projections = self._project(queries)
+        codes = (projections > 0) @ self._bit_values
+        n_probes = min(n_probes, projections.shape[2])
+        if n_probes == 0:
+            return codes[:, :, None]
+        flips = np.argsort(np.abs(projections), axis=2)[:, :, :n_probes]
+        return np.concatenate([codes[:, :, None], codes[:, :, None] ^ self._bit_values[flips]], axis=2)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, item_ids):
+        """Map ids to row positions; unknown ids map to -1."""
+        return lookup_positions(self.ids, item_ids, sorter=self._sorter)
+
+    def candidates(self, queries, n_probes=Config.CONTENT_ANN_PROBES):
+        """Return, per query row, the unique row positions sharing a probed bucket with it."""
+        probe_codes = self._probe_codes(queries, n_probes)
+        n_queries, n_tables, _ = probe_codes.shape
+        starts = np.empty(probe_codes.shape, dtype=np.int64)
+        ends = np.empty(probe_codes.shape, dtype=np.int64)
+        for table in range(n_tables):
+            starts[:, table] = np.searchsorted(self.codes[table], probe_codes[:, table], side='left')
+            ends[:, table] = np.searchsorted(self.codes[table], probe_codes[:, table], side='right')
+
+        result = []
+        for query in range(n_queries):
+            slices = [self.order[table, start:end]
+                      for table in range(n_tables)
+                      for start, end in zip(starts[query, table], ends[query, table]) if end > start]
+            result.append(np.unique(np.concatenate(slices)) if slices else np.empty(0, dtype=np.int32))
+        return result
+
+    def search(self, queries, top_n, exclude=None, n_probes=Config.CONTENT_ANN_PROBES, exact=False):
+        """Return each query's top-N (positions, cosines), best first, positive cosines only.
+
+        ``exact`` scores every row instead of the LSH candidates. ``exclude`` lists row
+        positions per query that are never returned for it.
+        """
+        queries = normalize_rows(queries)
+        candidate_sets = [None] * queries.shape[0] if exact else self.candidates(queries, n_probes)
+
+        results = []
+        for start in range(0, queries.shape[0], self.QUERY_BLOCK_SIZE):
+            block = queries[start:start + self.QUERY_BLOCK_SIZE]
+            # Exact search scores the whole block against every row in one product
+            block_scores = self._dense(block @ self.vectors.T) if exact else None
+
+            for offset, candidates in enumerate(candidate_sets[start:start + self.QUERY_BLOCK_SIZE]):
+                query = start + offset
+                if candidates is None:
+                    positions, scores = np.arange(len(self.ids)), block_scores[offset]
+                else:
+                    positions = candidates
+                    scores = self._dense(self.vectors[candidates] @ block[offset].T).ravel()
+                if exclude is not None and len(exclude[query]):
+                    scores[np.isin(positions, exclude[query])] = 0.0
+
+                keep = np.flatnonzero(scores > 0)
+                if len(keep) > top_n:
+                    keep = keep[np.argpartition(-scores[keep], top_n - 1)[:top_n]]
+                keep = keep[np.argsort(-scores[keep], kind='stable')]
+                results.append((positions[keep].astype(np.int32), scores[keep]))
+        return results
+
+    @staticmethod
+    def _dense(scores):
+        """Return a product of (possibly sparse) vectors as a writable float32 array."""
+        return np.array(scores.toarray() if sparse.issparse(scores) else scores, dtype=np.float32)
+
+    def top_similar(self, watched_sets, top_n, n_probes=Config.CONTENT_ANN_PROBES, exact=False):
+        """Score a batch of watched sets and return each set's top-N (ids, scores), best first.
+
+        Each set is represented by the normalized sum of its members' vectors, and movies are
+        ranked by their cosine to it; members of a set are never recommended back to it.
+        """
+        watched_positions = [self.positions(list(watched)) for watched in watched_sets]
+        watched_positions = [np.unique(positions[positions >= 0]) for positions in watched_positions]
+
+        rows = np.repeat(np.arange(len(watched_positions)), [len(p) for p in watched_positions])
+        columns = np.concatenate(watched_positions) if watched_positions else np.empty(0, dtype=np.int32)
+        selection = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), (rows, columns)),
+            shape=(len(watched_positions), len(self.ids)),
+        )
+        queries = selection @ self.vectors
+        queries = queries.tocsr() if sparse.issparse(queries) else np.asarray(queries, dtype=np.float32)
+
+        return [
+            (self.ids[positions], scores)
+            for positions, scores in self.search(queries, top_n, exclude=watched_positions,
+                                                 n_probes=n_probes, exact=exact)
+        ]
+
+    def save(self, directory, metadata=None):
+        """Persist the index as a memory-mappable artifact."""
+        arrays = {
+            'ids': self.ids,
+            'planes': self.planes,
+            'codes': self.codes,
+            'order': self.order,
+            'sorter': self._sorter,
+        }
+        if sparse.issparse(self.vectors):
+            arrays.update(sparse_to_arrays('vectors', self.vectors))
+        else:
+            arrays['vectors'] = self.vectors
+        save_artifact(directory, arrays, metadata)
+
+    @classmethod
+    def load(cls, directory, mmap=True, expected=None):
+        """Open an index saved with :meth:`save`; returns None if it is missing or stale."""
+        artifact = load_artifact(directory, mmap=mmap, expected=expected)
+        if artifact is None:
+            return None
+        arrays, _ = artifact
+        vectors = arrays['vectors'] if 'vectors' in arrays else arrays_to_sparse('vectors', arrays)
+        return cls(arrays['ids'], vectors, arrays['planes'], arrays['codes'], arrays['order'],
+                   sorter=arrays['sorter'])
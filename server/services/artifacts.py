@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+# Bump whenever the on-disk layout of an artifact changes; older artifacts are then rebuilt
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+# File in the artifacts root naming the published version directory
+CURRENT_NAME = 'CURRENT'
+
+def save_artifact(directory, arrays, metadata=None):
+    """Write ``arrays`` as raw .npy files plus a JSON manifest into ``directory``.
+
+    The artifact is written to a temporary sibling directory first and then renamed
+    into place, so readers never observe a half-written artifact.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': time.time(),
+        'arrays': {},
+        'metadata': metadata or {},
+    }
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(tmp_dir / f"{name}.npy", array, allow_pickle=False)
+        manifest['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+    with open(tmp_dir / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_dir = directory.with_name(f"{directory.name}.old-{os.getpid()}")
+    if directory.exists():
+        directory.rename(old_dir)
+    tmp_dir.rename(directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def read_manifest(directory):
+    """Return the manifest of the artifact in ``directory``, or None if there is no usable one."""
+    manifest_path = Path(directory) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        logging.warning(f"Ignoring artifact {directory}: format version {manifest.get('format_version')}, "
+                        f"expected {FORMAT_VERSION}")
+        return None
+    return manifest
+
+def file_fingerprint(path, content_hash=False):
+    """Fingerprint an input file by size and mtime, plus a SHA-256 of its bytes if requested.
+
+    A directory (e.g. a Parquet dataset) is fingerprinted over all of its visible files.
+    """
+    path = Path(path)
+    files = sorted(p for p in path.rglob('*') if p.is_file() and not p.name.startswith(('.', '_'))) \
+        if path.is_dir() else [path]
+    stats = [os.stat(f) for f in files]
+    fingerprint = {'name': path.name, 'size': sum(stat.st_size for stat in stats),
+                   'mtime_ns': max((stat.st_mtime_ns for stat in stats), default=0)}
+    if path.is_dir():
+        fingerprint['files'] = len(files)
+    if content_hash:
+        digest = hashlib.sha256()
+        for file in files:
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+def data_fingerprint(*arrays):
+    """Fingerprint in-memory input data by hashing the raw bytes of ``arrays``."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+    return {'sha256': digest.hexdigest()}
+
+def artifact_metadata(inputs, params):
+    """Build the manifest metadata that decides whether an artifact is still fresh."""
+    # Round-trip through JSON so tuples and numpy scalars compare equal to what is read back
+    return json.loads(json.dumps({'inputs': inputs, 'params': params}, default=str))
+
+def load_artifact(directory, mmap=True, expected=None):
+    """Open the arrays of an artifact, memory-mapped read-only by default.
+
+    Returns ``(arrays, metadata)`` or None when the artifact is missing or stale.
+    An artifact is stale when its format version differs or, if ``expected`` metadata
+    is given, when the recorded input fingerprints or parameters differ from it.
+    Memory-mapped arrays are backed by the OS page cache, so every process that
+    opens the same artifact shares a single copy of it.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if expected is not None:
+        for key, value in expected.items():
+            if manifest['metadata'].get(key) != value:
+                logging.info(f"Artifact {directory} is stale: '{key}' changed, rebuilding")
+                return None
+    mmap_mode = 'r' if mmap else None
+    arrays = {
+        name: np.load(Path(directory) / f"{name}.npy", mmap_mode=mmap_mode, allow_pickle=False)
+        for name in manifest['arrays']
+    }
+    return arrays, manifest['metadata']
+
+def sparse_to_arrays(prefix, matrix):
+    """Flatten a CSR matrix into ``{prefix}_data/_indices/_indptr/_shape`` arrays."""
+    matrix = sparse.csr_matrix(matrix)
+    return {
+        f"{prefix}_data": matrix.data,
+        f"{prefix}_indices": matrix.indices,
+        f"{prefix}_indptr": matrix.indptr,
+        f"{prefix}_shape": np.asarray(matrix.shape, dtype=np.int64),
+    }
+
+def arrays_to_sparse(prefix, arrays):
+    """Rebuild a CSR matrix from :func:`sparse_to_arrays` output without copying the buffers."""
+    return sparse.csr_matrix(
+        (arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]),
+        shape=tuple(int(n) for n in arrays[f"{prefix}_shape"]),
+        copy=False,
+    )
+
+def new_build_dir(root):
+    """Create a private working directory under ``root`` for a build that is not published yet."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    build_dir = root / f".build-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    build_dir.mkdir()
+    return build_dir
+
+def publish_version(root, build_dir):
+    """Publish a finished build as a new version and point ``CURRENT`` at it.
+
+    The build directory is renamed to its version name and the pointer file is replaced
+    atomically, so a reader resolving ``CURRENT`` sees either the old or the new version.
+    """
+    root = Path(root)
+    version = time.strftime('%Y%m%d-%H%M%S')
+    suffix = 0
+    while (root / version).exists():
+        suffix += 1
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+    Path(build_dir).rename(root / version)
+
+    pointer_tmp = root / f"{CURRENT_NAME}.tmp-{os.getpid()}"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, root / CURRENT_NAME)
+    logging.info(f"Published artifacts version {version}")
+    return root / version
+
+def current_version_dir(root):
+    """Return the directory of the published version; raises FileNotFoundError if there is none."""
+    pointer = Path(root) / CURRENT_NAME
+    if not pointer.exists():
+        raise FileNotFoundError(f"No published model artifacts in {root}; run build_models.py first")
+    version_dir = Path(root) / pointer.read_text().strip()
+    if not version_dir.is_dir():
+        raise FileNotFoundError(f"Published artifacts version {version_dir} is missing")
+    return version_dir
+
+def prune_versions(root, keep):
+    """Delete all but the ``keep`` newest versions, never the published one."""
+    root = Path(root)
+    current = (root / CURRENT_NAME).read_text().strip() if (root / CURRENT_NAME).exists() else None
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for version_dir in versions[:max(len(versions) - keep, 0)]:
+        if version_dir.name != current:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            logging.info(f"Pruned artifacts version {version_dir.name}")
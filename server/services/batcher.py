@@ -0,0 +1,65 @@
+import asyncio
+from config import Config
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+class MicroBatcher:
+    """Collects concurrent requests into micro-batches processed by one call.
+
+    A batch is flushed when it reaches ``max_batch_size`` items or when its first item
+    has waited ``max_wait`` seconds. ``process_batch`` runs in the default executor so
+    the event loop keeps accepting requests; it receives the list of items and returns
+    one result per item, where an Exception instance fails only that item.
+    """
+
+    def __init__(self, process_batch, max_batch_size=Config.BATCH_MAX_SIZE, max_wait=Config.BATCH_MAX_WAIT):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, item):
+        """Queue ``item`` for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for one item, then gather more until the batch is full or the wait expires."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.process_batch, items)
+            except Exception as e:
+                logging.error(f"Error processing batch of {len(items)}: {e}")
+                results = [e] * len(items)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
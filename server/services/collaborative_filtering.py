@@ -1,109 +1,198 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from config import Config
+from services.artifacts import artifact_metadata, data_fingerprint
+from services.neighbour_index import NeighbourIndex
+from services.scoring import top_n_per_row
 import logging
 import os
-import pickle
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 class CollaborativeFilter:
-    def __init__(self, user_item_matrix):
+    def __init__(self, user_item_matrix, cache_dir=Config.CACHE_DIR, fingerprint=None,
+                 item_index=None, user_index=None, build=True):
         self.user_item_matrix = user_item_matrix
-        self.item_similarity_df = None
-        self.user_similarity_df = None
-        self._initialize()
+        self.item_index = item_index
+        self.user_index = user_index
+        self.cache_dir = Path(cache_dir)
+        self.fingerprint = fingerprint
+        # Without build, prebuilt indexes are loaded as they are and never recomputed
+        self.allow_build = build
+        self._item_norms = None
+        self._user_norms = None
+        if item_index is None or user_index is None:
+            self._initialize()
     
     def _initialize(self):
-        """Initialize item and user similarity matrices."""
+        """Initialize item and user neighbour indexes, rebuilding only stale ones."""
         try:
-            # Try to load existing matrices
-            if self._load_matrices():
-                logging.info("Successfully loaded existing similarity matrices")
+            metadata = self._cache_metadata() if self.allow_build else None
+
+            # Try to load existing indexes
+            self.item_index = self._load_index("item_neighbours", metadata)
+            self.user_index = self._load_index("user_neighbours", metadata)
+            if self.item_index is not None and self.user_index is not None:
+                logging.info("Successfully loaded existing neighbour indexes")
                 return
+            if not self.allow_build:
+                raise FileNotFoundError(f"Neighbour indexes missing in {self.cache_dir}; run build_models.py")
 
-            # If loading failed, compute matrices
-            # Item-based similarity
-            item_similarity = cosine_similarity(self.user_item_matrix.T)
-            self.item_similarity_df = pd.DataFrame(item_similarity, 
-                                                  index=self.user_item_matrix.columns, 
-                                                  columns=self.user_item_matrix.columns)
-            logging.info("Item-based similarity matrix initialized")
+            # Compute the top-K neighbour indexes that are missing or stale
+            if self.item_index is None:
+                # Item-based similarity
+                self.item_index = NeighbourIndex.build(self.user_item_matrix.csc.T,
+                                                       self.user_item_matrix.movie_ids)
+                self._save_index(self.item_index, "item_neighbours", metadata)
+                logging.info("Item-based neighbour index initialized")
             
-            # User-based similarity
-            user_similarity = cosine_similarity(self.user_item_matrix)
-            self.user_similarity_df = pd.DataFrame(user_similarity, 
-                                                 index=self.user_item_matrix.index, 
-                                                 columns=self.user_item_matrix.index)
-            logging.info("User-based similarity matrix initialized")
-
-            # Save computed matrices
-            self._save_matrices()
+            if self.user_index is None:
+                # User-based similarity
+                self.user_index = NeighbourIndex.build(self.user_item_matrix.matrix,
+                                                       self.user_item_matrix.user_ids)
+                self._save_index(self.user_index, "user_neighbours", metadata)
+                logging.info("User-based neighbour index initialized")
         
         except Exception as e:
             logging.error(f"Error initializing collaborative filter: {e}")
             raise
 
-    def _save_matrices(self):
-        """Save similarity matrices to files."""
+    def _cache_metadata(self):
+        """Describe the inputs and parameters the cached indexes are built from."""
+        fingerprint = self.fingerprint
+        if fingerprint is None:
+            matrix = self.user_item_matrix
+            fingerprint = data_fingerprint(matrix.user_ids, matrix.movie_ids, matrix.matrix.indptr,
+                                           matrix.matrix.indices, matrix.matrix.data)
+        return artifact_metadata({'ratings': fingerprint}, {'neighbour_k': Config.NEIGHBOUR_K})
+
+    def _save_index(self, index, name, metadata):
+        """Save a neighbour index as a memory-mappable artifact."""
         try:
-            # Create directory if it doesn't exist
-            cache_dir = Path("cache")
-            cache_dir.mkdir(exist_ok=True)
-
-            # Save matrices
-            with open(cache_dir / "item_similarity.pkl", "wb") as f:
-                pickle.dump(self.item_similarity_df, f)
-            with open(cache_dir / "user_similarity.pkl", "wb") as f:
-                pickle.dump(self.user_similarity_df, f)
-            logging.info("Similarity matrices saved successfully")
+            index.save(self.cache_dir / name, metadata)
+            logging.info(f"Neighbour index '{name}' saved successfully")
         except Exception as e:
-            logging.error(f"Error saving matrices: {e}")
+            logging.error(f"Error saving neighbour index '{name}': {e}")
 
-    def _load_matrices(self):
-        """Load similarity matrices from files."""
+    def _load_index(self, name, metadata):
+        """Memory-map a neighbour index from its artifact if it is still fresh."""
         try:
-            cache_dir = Path("cache")
-            item_similarity_path = cache_dir / "item_similarity.pkl"
-            user_similarity_path = cache_dir / "user_similarity.pkl"
-
-            if not (item_similarity_path.exists() and user_similarity_path.exists()):
-                return False
-
-            with open(item_similarity_path, "rb") as f:
-                self.item_similarity_df = pickle.load(f)
-            with open(user_similarity_path, "rb") as f:
-                self.user_similarity_df = pickle.load(f)
-            return True
+            return NeighbourIndex.load(self.cache_dir / name, expected=metadata)
         except Exception as e:
-            logging.error(f"Error loading matrices: {e}")
-            return False
+            logging.error(f"Error loading neighbour index '{name}': {e}")
+            return None
     
+    @property
+    def item_norms(self):
+        """L2 norm of every movie's rating column, computed on first use."""
+        if self._item_norms is None:
+            csc = self.user_item_matrix.csc
+            self._item_norms = np.sqrt(np.asarray(csc.multiply(csc).sum(axis=0)).ravel()).astype(np.float32)
+        return self._item_norms
+
+    @property
+    def user_norms(self):
+        """L2 norm of every user's rating row, computed on first use."""
+        if self._user_norms is None:
+            matrix = self.user_item_matrix.matrix
+            self._user_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()).astype(np.float32)
+        return self._user_norms
+
+    def with_ratings(self, user_ids, movie_ids, ratings):
+        """Return a new filter with a batch of ratings applied incrementally.
+
+        Only the norms and neighbour lists of touched users and movies are recomputed;
+        this filter is left untouched so readers holding it keep a consistent view.
+        """
+        try:
+            user_item_matrix, touched_users, touched_movies = self.user_item_matrix.with_ratings(
+                user_ids, movie_ids, ratings)
+            matrix, csc = user_item_matrix.matrix, user_item_matrix.csc
+
+            item_norms = np.zeros(user_item_matrix.shape[1], dtype=np.float32)
+            item_norms[:len(self.item_norms)] = self.item_norms
+            touched_columns = csc[:, touched_movies]
+            item_norms[touched_movies] = np.sqrt(
+                np.asarray(touched_columns.multiply(touched_columns).sum(axis=0)).ravel())
+
+            user_norms = np.zeros(user_item_matrix.shape[0], dtype=np.float32)
+            user_norms[:len(self.user_norms)] = self.user_norms
+            touched_rows = matrix[touched_users]
+            user_norms[touched_users] = np.sqrt(
+                np.asarray(touched_rows.multiply(touched_rows).sum(axis=1)).ravel())
+
+            updated = CollaborativeFilter(
+                user_item_matrix,
+                cache_dir=self.cache_dir,
+                fingerprint=self.fingerprint,
+                item_index=self.item_index.updated(csc.T, item_norms, user_item_matrix.movie_ids, touched_movies),
+                user_index=self.user_index.updated(matrix, user_norms, user_item_matrix.user_ids, touched_users),
+            )
+            updated._item_norms, updated._user_norms = item_norms, user_norms
+            return updated
+        except Exception as e:
+            logging.error(f"Error applying ratings to collaborative filter: {e}")
+            raise
+
     def item_based_recommendations(self, watched_movies, top_n):
         """Get item-based collaborative filtering recommendations."""
+        movie_ids, _ = self.item_based_scores([watched_movies], top_n)[0]
+        return pd.Index(movie_ids)
+
+    def item_based_scores(self, watched_sets, top_n):
+        """Get item-based (movie_ids, scores) for a batch of watched sets in one vectorized pass."""
         try:
-            scores = pd.Series(0.0, index=self.user_item_matrix.columns)
-            for item in watched_movies:
-                if item in self.item_similarity_df.index:
-                    similar_scores = self.item_similarity_df[item]
-                    scores = scores.add(similar_scores, fill_value=0)
-            return scores.sort_values(ascending=False).head(top_n).index
+            return self.item_index.top_similar(watched_sets, top_n)
         except Exception as e:
             logging.error(f"Error in item-based recommendations: {e}")
             raise
     
-    def user_based_recommendations(self, user_ids, top_n):
+    def user_based_recommendations(self, user_ids, top_n, n_neighbours=Config.USER_BASED_NEIGHBOURS,
+                                   max_seed_users=Config.USER_BASED_MAX_SEED_USERS, rng=None):
         """Get user-based collaborative filtering recommendations."""
+        movie_ids, _ = self.user_based_scores([user_ids], top_n, n_neighbours, max_seed_users, rng)[0]
+        return pd.Index(movie_ids)
+
+    def user_based_scores(self, user_id_sets, top_n, n_neighbours=Config.USER_BASED_NEIGHBOURS,
+                          max_seed_users=Config.USER_BASED_MAX_SEED_USERS, rng=None):
+        """Get user-based (movie_ids, scores) for a batch of seed user sets.
+
+        Each set is capped to ``max_seed_users`` randomly sampled users; their ``n_neighbours``
+        nearest users are looked up at once and their rating rows are summed, weighted by
+        similarity, in a single sparse product.
+        """
         try:
-            recommendations = pd.Series(dtype=float)
-            for user_id in user_ids:
-                if user_id in self.user_similarity_df.index:
-                    similar_users = self.user_similarity_df[user_id].sort_values(ascending=False)[1:11]
-                    for sim_user, similarity in similar_users.items():
-                        user_ratings = self.user_item_matrix.loc[sim_user]
-                        rated_items = user_ratings[user_ratings > 0]
-                        recommendations = recommendations.add(rated_items * similarity, fill_value=0)
-            return recommendations.sort_values(ascending=False).head(top_n).index
+            rng = rng if rng is not None else np.random.default_rng()
+            rows, columns, weights = [], [], []
+            for set_index, user_ids in enumerate(user_id_sets):
+                positions = self.user_item_matrix.user_positions(list(user_ids))
+                positions = np.unique(positions[positions >= 0])
+                if len(positions) > max_seed_users:
+                    positions = rng.choice(positions, max_seed_users, replace=False)
+
+                neighbours = self.user_index.neighbours[positions, :n_neighbours].ravel()
+                similarities = self.user_index.scores[positions, :n_neighbours].ravel()
+                valid = similarities > 0
+                rows.append(np.full(valid.sum(), set_index, dtype=np.int32))
+                columns.append(neighbours[valid])
+                weights.append(similarities[valid])
+
+            n_sets, n_users = len(user_id_sets), self.user_item_matrix.shape[0]
+            neighbour_weights = sparse.csr_matrix(
+                (np.concatenate(weights) if weights else np.empty(0, dtype=np.float32),
+                 (np.concatenate(rows) if rows else np.empty(0, dtype=np.int32),
+                  np.concatenate(columns) if columns else np.empty(0, dtype=np.int32))),
+                shape=(n_sets, n_users),
+                dtype=np.float32,
+            )
+            score_matrix = (neighbour_weights @ self.user_item_matrix.matrix).tocsr()
+
+            return [
+                (self.user_item_matrix.movie_ids[positions], scores)
+                for positions, scores in top_n_per_row(score_matrix, top_n)
+            ]
         except Exception as e:
             logging.error(f"Error in user-based recommendations: {e}")
             raise
\ No newline at end of file
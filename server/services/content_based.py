@@ -1,60 +1,97 @@
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
-import joblib
+from config import Config
+from services.artifacts import (artifact_metadata, arrays_to_sparse, data_fingerprint, load_artifact,
+                                save_artifact, sparse_to_arrays)
+from services.ann_index import LshIndex, reduce_dimensions
+from services.neighbour_index import NeighbourIndex
 import os
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 class ContentBasedFilter:
-    def __init__(self, movies_df, cache_dir='cache'):
+    TFIDF_PARAMS = {'stop_words': 'english'}
+
+    def __init__(self, movies_df, cache_dir=Config.CACHE_DIR, fingerprint=None, build=True):
         self.movies_df = movies_df
         self.tfidf_matrix = None
-        self.content_similarity_df = None
+        self.content_index = None
         self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(exist_ok=True)
+        self.fingerprint = fingerprint
+        # Without build, prebuilt artifacts are loaded as they are and never recomputed
+        self.allow_build = build
+        if build:
+            self.cache_dir.mkdir(exist_ok=True)
         self._initialize()
     
     def _initialize(self):
-        """Initialize TF-IDF matrix and content similarity with caching."""
+        """Initialize TF-IDF matrix and content index (exact or approximate) with caching."""
         try:
-            cache_file = self.cache_dir / 'tfidf_matrix.joblib'
-            similarity_cache_file = self.cache_dir / 'content_similarity.joblib'
+            metadata = self._cache_metadata() if self.allow_build else None
+            tfidf_dir = self.cache_dir / 'tfidf_matrix'
+            index_dir = self.cache_dir / ('content_ann' if self.uses_ann else 'content_neighbours')
+            index_class = LshIndex if self.uses_ann else NeighbourIndex
             
-            # Try to load from cache
-            if cache_file.exists() and similarity_cache_file.exists():
-                logging.info("Loading TF-IDF matrix and similarity from cache")
-                self.tfidf_matrix = joblib.load(cache_file)
-                self.content_similarity_df = joblib.load(similarity_cache_file)
+            # Try to memory-map from cache
+            tfidf_artifact = load_artifact(tfidf_dir, expected=metadata)
+            content_index = index_class.load(index_dir, expected=metadata)
+            if tfidf_artifact is not None and content_index is not None:
+                logging.info("Loading TF-IDF matrix and content index from cache")
+                self.tfidf_matrix = arrays_to_sparse('tfidf', tfidf_artifact[0])
+                self.content_index = content_index
+            elif not self.allow_build:
+                raise FileNotFoundError(f"Content artifacts missing in {self.cache_dir}; run build_models.py")
             else:
-                logging.info("Computing TF-IDF matrix and similarity")
-                tfidf = TfidfVectorizer(stop_words='english')
+                logging.info("Computing TF-IDF matrix and content index")
+                from sklearn.feature_extraction.text import TfidfVectorizer
+                tfidf = TfidfVectorizer(**self.TFIDF_PARAMS)
                 self.tfidf_matrix = tfidf.fit_transform(self.movies_df['content'])
-                content_similarity = cosine_similarity(self.tfidf_matrix)
-                self.content_similarity_df = pd.DataFrame(content_similarity, 
-                                                       index=self.movies_df['movieId'], 
-                                                       columns=self.movies_df['movieId'])
+                movie_ids = self.movies_df['movieId'].to_numpy()
+                if self.uses_ann:
+                    # Large catalogs: approximate search over (optionally SVD-reduced) TF-IDF vectors
+                    self.content_index = LshIndex.build(reduce_dimensions(self.tfidf_matrix), movie_ids)
+                else:
+                    # Small catalogs: exact top-K neighbour lists
+                    self.content_index = NeighbourIndex.build(self.tfidf_matrix, movie_ids)
                 
                 # Save to cache
-                joblib.dump(self.tfidf_matrix, cache_file)
-                joblib.dump(self.content_similarity_df, similarity_cache_file)
-                logging.info("TF-IDF matrix and similarity saved to cache")
+                save_artifact(tfidf_dir, sparse_to_arrays('tfidf', self.tfidf_matrix), metadata)
+                self.content_index.save(index_dir, metadata)
+                logging.info("TF-IDF matrix and content index saved to cache")
                 
         except Exception as e:
             logging.error(f"Error initializing content-based filter: {e}")
             raise
     
+    def _cache_metadata(self):
+        """Describe the inputs and parameters the cached artifacts are built from."""
+        fingerprint = self.fingerprint
+        if fingerprint is None:
+            content_hashes = pd.util.hash_pandas_object(self.movies_df[['movieId', 'content']], index=False)
+            fingerprint = data_fingerprint(content_hashes.to_numpy())
+        params = {'tfidf': self.TFIDF_PARAMS}
+        if self.uses_ann:
+            params['ann'] = {'svd_components': Config.CONTENT_SVD_COMPONENTS, 'tables': Config.CONTENT_ANN_TABLES,
+                             'bucket_size': Config.CONTENT_ANN_BUCKET_SIZE}
+        else:
+            params['neighbour_k'] = Config.NEIGHBOUR_K
+        return artifact_metadata({'movies': fingerprint}, params)
+
+    @property
+    def uses_ann(self):
+        """Whether the catalog is large enough to be served from the approximate index."""
+        return len(self.movies_df) >= Config.CONTENT_ANN_MIN_ITEMS
+
     def get_recommendations(self, watched_movies, top_n):
         """Get content-based recommendations for watched movies."""
+        movie_ids, _ = self.get_scores([watched_movies], top_n)[0]
+        return pd.Index(movie_ids)
+
+    def get_scores(self, watched_sets, top_n):
+        """Get content-based (movie_ids, scores) for a batch of watched sets in one vectorized pass."""
         try:
-            scores = pd.Series(0.0, index=self.movies_df['movieId'])
-            for movie_id in watched_movies:
-                if movie_id in self.content_similarity_df.index:
-                    similar_scores = self.content_similarity_df[movie_id]
-                    scores = scores.add(similar_scores, fill_value=0)
-            return scores.sort_values(ascending=False).head(top_n).index
+            return self.content_index.top_similar(watched_sets, top_n)
         except Exception as e:
             logging.error(f"Error in content-based recommendations: {e}")
-            raise
\ No newline at end of file
+            raise
@@ -1,10 +1,29 @@
+import os
 import pandas as pd
 import logging
 from config import Config
+from services.artifacts import file_fingerprint
+from services.id_index import MovieIdIndex
+from services.user_item_matrix import UserItemMatrix
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
+# Only these columns are read, with compact dtypes; db_id stays float because it has gaps
+MOVIE_DTYPES = {'movieId': 'int32', 'title': 'object', 'genres': 'object', 'db_id': 'float64'}
+RATING_DTYPES = {'userId': 'int32', 'movieId': 'int32', 'rating': 'float32'}
+
+def is_parquet(path):
+    """Whether ``path`` is a Parquet file or a directory of Parquet parts."""
+    return str(path).endswith('.parquet') or os.path.isdir(path)
+
+def read_table(path, dtypes):
+    """Read only the ``dtypes`` columns of a CSV or Parquet table, cast to those dtypes."""
+    columns = list(dtypes)
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns).astype(dtypes, copy=False)
+    return pd.read_csv(path, usecols=columns, dtype=dtypes)[columns]
+
 class DataLoader:
     def __init__(self, movies_path=Config.MOVIES_PATH, ratings_path=Config.RATINGS_PATH):
         self.movies_path = movies_path
@@ -12,28 +31,22 @@ class DataLoader:
         self.movies_df = None
         self.ratings_df = None
         self.user_item_matrix = None
+        self.movie_index = None
+        self.fingerprints = {}
     
     def load_data(self):
         """Load and preprocess movie and rating data."""
         try:
-            # Load movies
-            self.movies_df = pd.read_csv(self.movies_path)
-            self.movies_df.dropna(subset=['title', 'genres'], inplace=True)
-            self.movies_df['genres'] = self.movies_df['genres'].str.replace('|', ' ')
-            self.movies_df['content'] = self.movies_df['title'] + ' ' + self.movies_df['genres']
-
-            self.dbid_to_movieid = dict(zip(self.movies_df['db_id'], self.movies_df['movieId']))
-            logging.info("Movies data loaded and preprocessed")
+            self.load_movies()
             
             # Load ratings
-            self.ratings_df = pd.read_csv(self.ratings_path)
+            self.ratings_df = read_table(self.ratings_path, RATING_DTYPES)
+            self.fingerprints['ratings'] = file_fingerprint(self.ratings_path, Config.CACHE_CONTENT_HASH)
             logging.info("Ratings data loaded")
             
-            # Create user-item matrix
-            self.user_item_matrix = self.ratings_df.pivot(index='userId', 
-                                                        columns='movieId', 
-                                                        values='rating').fillna(0)
-            logging.info("User-item matrix created")
+            # Create sparse user-item matrix
+            self.user_item_matrix = UserItemMatrix.from_ratings(self.ratings_df)
+            logging.info(f"User-item matrix created: {self.user_item_matrix.shape}, {self.user_item_matrix.nnz} ratings")
             
             return self.movies_df, self.ratings_df, self.user_item_matrix
         
@@ -43,11 +56,39 @@ class DataLoader:
         except Exception as e:
             logging.error(f"Error loading data: {e}")
             raise
+
+    def load_movies(self):
+        """Load and preprocess the movie catalog only."""
+        try:
+            # Load movies
+            self.movies_df = self.read_movies()
+            self.fingerprints['movies'] = file_fingerprint(self.movies_path, Config.CACHE_CONTENT_HASH)
+            self.movies_df.dropna(subset=['title', 'genres'], inplace=True)
+            # genres stay pipe-separated; only the TF-IDF text needs them as words
+            self.movies_df['content'] = self.movies_df['title'] + ' ' + self.movies_df['genres'].str.replace('|', ' ')
+            # Few distinct genre strings: store them once
+            self.movies_df['genres'] = self.movies_df['genres'].astype('category')
+
+            self.movie_index = MovieIdIndex.from_movies(self.movies_df)
+            logging.info("Movies data loaded and preprocessed")
+            return self.movies_df
+        
+        except FileNotFoundError as e:
+            logging.error(f"Data file not found: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Error loading movies: {e}")
+            raise
     
+    def read_movies(self):
+        """Read the raw movie table (needed columns only), before any preprocessing."""
+        return read_table(self.movies_path, MOVIE_DTYPES)
+
     def validate_movie_ids(self, movie_ids):
         """Validate if movie IDs exist in the dataset."""
-        if self.movies_df is None:
+        if self.movie_index is None:
             raise ValueError("Movies data not loaded")
-        invalid_ids = [mid for mid in movie_ids if mid not in self.movies_df['movieId'].values]
+        movie_ids = list(movie_ids)
+        invalid_ids = [mid for mid, known in zip(movie_ids, self.movie_index.has_movies(movie_ids)) if not known]
         if invalid_ids:
             raise ValueError(f"Invalid movie IDs: {invalid_ids}")
\ No newline at end of file
@@ -0,0 +1,137 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import atexit
+import multiprocessing
+import threading
+import time
+from config import Config
+from services.metrics import SOURCE_FAILURES, SOURCE_SECONDS
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+# Source callables inherited by forked worker processes, keyed by source name
+_worker_sources = {}
+# How often queued calls are checked for having started, which starts their timeout
+_START_POLL_SECONDS = 0.005
+
+def _run_source(name, args):
+    """Entry point of a source call inside a worker process."""
+    return _worker_sources[name](*args)
+
+def _noop():
+    return None
+
+class SourceExecutor:
+    """Long-lived pool that runs the recommendation sources of every request.
+
+    ``kind`` is 'thread' or 'process'. Process workers are forked once at :meth:`start`
+    and inherit the source callables registered there; the models they use are the
+    memory-mapped artifacts, so the pages are shared with the parent rather than copied.
+    Because of that, process workers keep serving the models they were forked with, so
+    the API rejects ingestion with a process pool; use the thread pool for it. Sources that
+    miss the per-request ``timeout`` are dropped from that request; the timeout counts
+    from when a call starts running, so time queued behind other requests is not held
+    against it.
+    """
+
+    def __init__(self, kind=Config.EXECUTOR_TYPE, max_workers=Config.EXECUTOR_WORKERS,
+                 timeout=Config.SOURCE_TIMEOUT):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Executor type must be 'thread' or 'process', got {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def start(self, sources=None):
+        """Create the pool; process pools fork their workers now with ``sources`` registered."""
+        with self._lock:
+            if self._pool is not None:
+                return self
+            if self.kind == 'process':
+                _worker_sources.clear()
+                _worker_sources.update(sources or {})
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('fork'))
+                # With the fork context every worker is started on the first submit
+                self._pool.submit(_noop).result()
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='recommender')
+            atexit.register(self.shutdown)
+            logging.info(f"Started {self.kind} pool with {self.max_workers} workers")
+            return self
+
+    def run(self, calls):
+        """Run ``(name, fn, args)`` calls concurrently and return ``{name: result}``.
+
+        Calls that fail or do not finish within the timeout are logged and left out
+        of the result, so the caller can degrade to the sources that did answer.
+        """
+        self.start()
+        start = time.perf_counter()
+        if self.kind == 'process':
+            futures = {self._pool.submit(_run_source, name, args): name for name, _, args in calls}
+        else:
+            futures = {self._pool.submit(fn, *args): name for name, fn, args in calls}
+
+        # Timed from submission in the caller's process, so the same clock works for both pool kinds
+        for future, name in futures.items():
+            future.add_done_callback(lambda f, name=name: f.cancelled() or SOURCE_SECONDS.observe(
+                time.perf_counter() - start, source=name))
+
+        started, timed_out = {}, set()
+        pending = set(futures)
+        while pending:
+            now = time.perf_counter()
+            for future in pending:
+                if future not in started and (future.running() or future.done()):
+                    started[future] = now
+            for future in pending:
+                if (self.timeout is None or future.done()
+                        or now - started.get(future, now) < self.timeout):
+                    continue
+                future.cancel()
+                timed_out.add(future)
+                name = futures[future]
+                SOURCE_FAILURES.inc(source=name, reason='timeout')
+                logging.warning(f"Source '{name}' timed out after {self.timeout}s, skipping it")
+            pending = {future for future in pending
+                       if not future.done() and future not in timed_out}
+            if pending and self.timeout is None:
+                wait(pending, return_when=FIRST_COMPLETED)
+            elif pending:
+                # Wake up on a completion, the next deadline, or to notice a queued call starting
+                waits = [started[future] + self.timeout - now
+                         for future in pending if future in started]
+                if len(waits) < len(pending):
+                    waits.append(_START_POLL_SECONDS)
+                wait(pending, timeout=max(min(waits), 0.0), return_when=FIRST_COMPLETED)
+        done = [future for future in futures if future not in timed_out]
+
+        results = {}
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                SOURCE_FAILURES.inc(source=futures[future], reason='error')
+                logging.error(f"Source '{futures[future]}' failed: {e}")
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+_default_executor = None
+_default_lock = threading.Lock()
+
+def default_executor():
+    """Return the process-wide thread executor shared by recommenders that were not given one."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = SourceExecutor(kind='thread')
+        return _default_executor
@@ -0,0 +1,115 @@
+from collections import namedtuple
+import numpy as np
+from services.scoring import top_n
+
+FUSION_METHODS = ('weighted', 'rrf')
+AGGREGATIONS = ('average', 'least_misery', 'most_pleasure', 'fairness')
+
+# Candidate pool of one request: parallel arrays of movieIds and their non-negative sampling weights
+CandidatePool = namedtuple('CandidatePool', ['movie_ids', 'weights'])
+
+def _contributions(ranked_lists, method, rrf_k):
+    """Concatenated movieIds and per-source score contributions of best-first ranked lists."""
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Fusion method must be one of {FUSION_METHODS}, got {method!r}")
+
+    all_ids, contributions = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float64)]
+    for movie_ids, scores, weight in ranked_lists:
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if weight <= 0 or not movie_ids.size:
+            continue
+        if method == 'rrf':
+            contribution = weight / (rrf_k + np.arange(1, movie_ids.size + 1, dtype=np.float64))
+        else:
+            scores = np.clip(np.asarray(scores, dtype=np.float64), 0, None)
+            best = scores.max()
+            if best <= 0:
+                continue
+            contribution = weight * scores / best
+        all_ids.append(movie_ids)
+        contributions.append(contribution)
+    return np.concatenate(all_ids), np.concatenate(contributions)
+
+def _excluded(movie_ids, exclude):
+    if not len(exclude):
+        return np.zeros(movie_ids.size, dtype=bool)
+    return np.isin(movie_ids, np.fromiter(exclude, dtype=np.int64, count=len(exclude)))
+
+def fuse(ranked_lists, exclude=(), method='weighted', rrf_k=60):
+    """Fuse best-first ``(movie_ids, scores, weight)`` lists of the sources into one pool.
+
+    ``weighted`` sums each source's scores divided by its best score, times the source
+    weight, so a movie ranked highly by several sources outranks one a single source
+    barely returned. ``rrf`` (reciprocal-rank fusion) sums ``weight / (rrf_k + rank)``
+    and ignores score scales altogether. Movies in ``exclude`` are dropped.
+    """
+    all_ids, contributions = _contributions(ranked_lists, method, rrf_k)
+    movie_ids, inverse = np.unique(all_ids, return_inverse=True)
+    weights = np.bincount(inverse, weights=contributions, minlength=movie_ids.size)
+
+    keep = (weights > 0) & ~_excluded(movie_ids, exclude)
+    return CandidatePool(movie_ids[keep], weights[keep])
+
+def sample_without_replacement(weights, k, uniform):
+    """Return ``min(k, len(weights))`` distinct positions drawn proportionally to ``weights``.
+
+    Efraimidis-Spirakis: keeping the ``k`` largest keys ``u ** (1 / w)`` is an exact
+    weighted draw without replacement (the Gumbel-top-k trick in log space). ``uniform``
+    holds one draw from [0, 1) per weight, taken from the caller's RNG. Zero-weight
+    positions only fill the tail, in random order, once the weighted ones run out.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    positive = np.flatnonzero(weights > 0)
+    # log(1 - u) / w, with 1 - u in (0, 1]
+    chosen = positive[top_n(np.log1p(-uniform[positive]) / weights[positive], k)]
+    if len(chosen) < k:
+        zero = np.flatnonzero(weights <= 0)
+        chosen = np.concatenate([chosen, zero[np.argsort(uniform[zero])][:k - len(chosen)]])
+    return chosen
+
+def member_matrix(member_ranked_lists, exclude=(), method='weighted', rrf_k=60):
+    """Fuse every group member's ranked lists, as :func:`fuse` does, into one aligned array.
+
+    Returns ``(candidate_ids, scores)`` where ``scores`` is a members x candidates array
+    over the union of the members' candidates; a member scores 0 on candidates none of
+    their sources returned. All members are fused in one pass over their concatenated lists.
+    """
+    member_ids, member_contributions, rows = [], [], []
+    for row, ranked_lists in enumerate(member_ranked_lists):
+        all_ids, contributions = _contributions(ranked_lists, method, rrf_k)
+        member_ids.append(all_ids)
+        member_contributions.append(contributions)
+        rows.append(np.full(all_ids.size, row, dtype=np.int64))
+
+    candidate_ids, inverse = np.unique(np.concatenate(member_ids), return_inverse=True)
+    n_members, n_candidates = len(member_ranked_lists), candidate_ids.size
+    scores = np.bincount(np.concatenate(rows) * n_candidates + inverse, weights=np.concatenate(member_contributions),
+                         minlength=n_members * n_candidates).reshape(n_members, n_candidates)
+
+    keep = ~_excluded(candidate_ids, exclude)
+    return candidate_ids[keep], scores[:, keep]
+
+def aggregate(scores, strategy, n):
+    """Combine a members x candidates score array into one group score per candidate.
+
+    ``average`` and ``most_pleasure`` / ``least_misery`` (max / min over members) are the
+    classic group strategies. ``fairness`` is an average that gives more say to members
+    the plain average serves worst: each member's satisfaction is the share of their own
+    best ``n`` scores that the average's top ``n`` reaches, and members are weighted by
+    ``2 - satisfaction``, so an unserved member counts twice as much as a fully served one.
+    """
+    if strategy not in AGGREGATIONS:
+        raise ValueError(f"Aggregation must be one of {AGGREGATIONS}, got {strategy!r}")
+    if strategy == 'average':
+        return scores.mean(axis=0)
+    if strategy == 'least_misery':
+        return scores.min(axis=0)
+    if strategy == 'most_pleasure':
+        return scores.max(axis=0)
+
+    shortlist = top_n(scores.mean(axis=0), n)
+    best = -np.sort(-scores, axis=1)[:, :n].sum(axis=1)
+    reached = scores[:, shortlist].sum(axis=1)
+    satisfaction = np.divide(reached, best, out=np.ones(len(scores)), where=best > 0)
+    member_weights = 2.0 - satisfaction
+    return member_weights @ scores / member_weights.sum()
@@ -1,107 +1,280 @@
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
+import threading
+import numpy as np
 from config import Config
+from services.executor import default_executor
+from services.fusion import AGGREGATIONS, CandidatePool, aggregate, fuse, member_matrix, sample_without_replacement
+from services.id_index import MovieIdIndex
+from services.lazy import model_status, peek
+from services.metrics import CACHE_LOOKUPS, POOL_SIZE, STAGE_SECONDS
+from services.result_cache import ResultCache
 import logging
-import random
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 class HybridRecommender:
-    def __init__(self, movies_df, content_filter, collaborative_filter, weights=Config.WEIGHTS):
+    SOURCES = ('item_based', 'user_based', 'content_based', 'matrix_factorization')
+    # Sources that may be left out; their weight defaults to 0 and must stay 0 when they are
+    OPTIONAL_SOURCES = ('matrix_factorization',)
+    # 'union' scores the group as one merged member; the others score members separately and aggregate
+    AGGREGATIONS = ('union',) + AGGREGATIONS
+
+    def __init__(self, movies_df, content_filter, collaborative_filter, weights=Config.WEIGHTS, result_cache=None,
+                 popularity_model=None, movie_index=None, executor=None, matrix_factorization=None,
+                 fusion=Config.FUSION_METHOD, rng=Config.RANDOM_SEED):
         self.movies_df = movies_df
         self.content_filter = content_filter
         self.collaborative_filter = collaborative_filter
+        self.matrix_factorization = matrix_factorization
         self.weights = weights
+        self.popularity_model = popularity_model
+        self.movie_index = movie_index if movie_index is not None else MovieIdIndex.from_movies(movies_df)
+        self.executor = executor if executor is not None else default_executor()
+        self.fusion = fusion
+        # A seed or a numpy Generator; draws are serialized because a Generator is not thread-safe
+        self.rng = np.random.default_rng(rng)
+        self._rng_lock = threading.Lock()
+        # Candidate pools are deterministic for a snapshot, so a new recommender starts with an empty cache
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+
+    def with_collaborative_filter(self, collaborative_filter):
+        """Return a recommender sharing everything but the collaborative filter, with a fresh cache."""
+        return HybridRecommender(self.movies_df, self.content_filter, collaborative_filter, self.weights,
+                                 popularity_model=self.popularity_model, movie_index=self.movie_index,
+                                 executor=self.executor, matrix_factorization=self.matrix_factorization,
+                                 fusion=self.fusion, rng=self.rng)
+
+    def _source_models(self):
+        """Map each source name to its model, which may be a LazyModel still loading, or None when disabled."""
+        return {
+            'item_based': self.collaborative_filter,
+            'user_based': self.collaborative_filter,
+            'content_based': self.content_filter,
+            'matrix_factorization': self.matrix_factorization,
+        }
+
+    def enabled_sources(self):
+        return [name for name, model in self._source_models().items() if model is not None]
+
+    def source_status(self):
+        """Load status ('cold', 'loading', 'ready' or 'failed') of every enabled source."""
+        return {name: model_status(model) for name, model in self._source_models().items() if model is not None}
+
+    def source_functions(self):
+        """Map each ready source name to the callable that scores a batch of requests for it.
+
+        Sources whose model is still loading are left out, and asking starts loading them.
+        """
+        collaborative_filter = peek(self.collaborative_filter)
+        content_filter = peek(self.content_filter)
+        matrix_factorization = peek(self.matrix_factorization)
+        functions = {}
+        if collaborative_filter is not None:
+            functions['item_based'] = collaborative_filter.item_based_scores
+            functions['user_based'] = collaborative_filter.user_based_scores
+        if content_filter is not None:
+            functions['content_based'] = content_filter.get_scores
+        if matrix_factorization is not None:
+            functions['matrix_factorization'] = matrix_factorization.get_scores
+        return functions
 
     def validate_weights(self):
-        """Validate that weights sum to approximately 1."""
-        total = sum(self.weights.values())
-        if abs(total - 1.0) > 0.01:
-            raise ValueError(f"Weights must sum to 1, got {total}")
+        """Validate the default weights with the same rules a request's weights must pass."""
+        self._resolve_weights(self.weights)
 
-    def get_recommendations(self, user_ids, watched_movies, top_n=Config.DEFAULT_TOP_N, weights=Config.WEIGHTS):
-        """Get hybrid recommendations by randomly sampling movies with weights, or popular movies if watched_movies is empty."""
+    def get_recommendations(self, user_ids, watched_movies, top_n=Config.DEFAULT_TOP_N, weights=Config.WEIGHTS, genre=None,
+                            members=None, aggregation='union'):
+        """Get hybrid recommendations by weighted sampling without replacement, or popular movies if watched_movies is empty.
 
-        if weights:
-            self.weights = weights
-        if not all(k in self.weights for k in ['item_based', 'user_based', 'content_based']) or not abs(sum(self.weights.values()) - 1.0) < 1e-6:
-            raise ValueError("Weights must include 'item_based', 'user_based', 'content_based' and sum to 1.")
+        ``genre`` only narrows the popular movies used when watched_movies is empty.
+        ``members`` lists each group member's ``(watched_movies, user_ids)``; with an
+        ``aggregation`` other than 'union' every member is scored on their own and the
+        member scores are combined by that strategy.
+        """
+        result = self.get_recommendations_batch([{
+            'user_ids': user_ids,
+            'watched_movies': watched_movies,
+            'top_n': top_n,
+            'weights': weights,
+            'genre': genre,
+            'members': members,
+            'aggregation': aggregation,
+        }])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get_recommendations_batch(self, requests):
+        """Get recommendations for a batch of requests with one scoring pass per source.
+
+        Each request is a dict of :meth:`get_recommendations` arguments. Requests whose
+        candidate pool is not cached are scored together: every ready source with a weight
+        runs once over all of their watched sets, one row per member for group aggregations.
+        Sources still loading are skipped and their weight goes to the ready ones. The result
+        list holds, per request, either its recommendations or the ValueError that rejected it.
+        """
+        results = [None] * len(requests)
+        pools = {}
+        pending = []
 
         try:
-            if watched_movies:
-                # Parallel retrieval of recommendations when watched_movies is non-empty
-                with ThreadPoolExecutor() as executor:
-                    futures = [
-                        executor.submit(self.collaborative_filter.item_based_recommendations, watched_movies, top_n * 3),
-                        executor.submit(self.collaborative_filter.user_based_recommendations, user_ids, top_n * 3),
-                        executor.submit(self.content_filter.get_recommendations, watched_movies, top_n * 3)
-                    ]
-                    item_based_recs, user_based_recs, content_based_recs = [f.result() for f in futures]
-
-                # Prepare recommendation sources and their weights
-                rec_sources = [
-                    ('item_based', item_based_recs, self.weights['item_based']),
-                    ('user_based', user_based_recs, self.weights['user_based']),
-                    ('content_based', content_based_recs, self.weights['content_based'])
-                ]
+            for i, request in enumerate(requests):
+                try:
+                    weights = self._resolve_weights(request.get('weights'))
+                    members = self._resolve_members(request)
+                except ValueError as e:
+                    results[i] = e
+                    continue
+
+                watched_movies = request['watched_movies']
+                top_n = request.get('top_n', Config.DEFAULT_TOP_N)
+                # Candidate pools are cached per (watched set, top_n, weights); sampling below stays per call
+                genre = None if watched_movies else request.get('genre')
+                cache_key = (tuple(sorted(watched_movies)), top_n, tuple(weights[k] for k in self.SOURCES), genre)
+                if members is not None:
+                    cache_key += (request['aggregation'], tuple(sorted(tuple(sorted(watched)) for watched, _ in members)))
+                pools[i] = self.result_cache.get(cache_key)
+                CACHE_LOOKUPS.inc(result='miss' if pools[i] is None else 'hit')
+                if pools[i] is not None:
+                    continue
+                if watched_movies:
+                    pending.append((i, cache_key, weights, members))
+                else:
+                    pools[i] = self._servable(self._popular_pool(top_n, genre))
+                    POOL_SIZE.observe(pools[i].movie_ids.size, kind='popular')
+                    self.result_cache.put(cache_key, pools[i])
+
+            if pending:
+                self._score_pending(requests, pending, pools)
 
-                logging.info(f"Recommendation sources: {[(source, len(recs)) for source, recs, _ in rec_sources]}")
-
-                # Combine all unique movie IDs (movieId)
-                all_movies = set()
-                for _, rec_list, _ in rec_sources:
-                    all_movies.update(rec_list)
-
-                # Remove watched movies (movieId)
-                all_movies.difference_update(watched_movies)
-
-                # Create a list of (movie_id, source_weight) for weighted random sampling
-                movie_weight_pairs = []
-                for movie_id in all_movies:
-                    # Sum weights of sources that recommended this movie
-                    movie_weight = sum(weight for source, rec_list, weight in rec_sources if movie_id in rec_list)
-                    movie_weight_pairs.append((movie_id, movie_weight))
-            else:
-                # Handle empty watched_movies: select popular movies
-                logging.info("watched_movies is empty, selecting popular movies")
-                
-                # Select top 3*top_n movies by popularity (e.g., rating)
-                if 'rating' in self.movies_df.columns:
-                    popular_movies = self.movies_df.sort_values(by='rating', ascending=False).head(top_n * 3)
-                    movie_ids = popular_movies['movieId'].tolist()
-                    weights = popular_movies['rating'].tolist()
+            with STAGE_SECONDS.time(stage='sampling'):
+                for i, request in enumerate(requests):
+                    if results[i] is None:
+                        results[i] = self._sample(pools[i], request.get('top_n', Config.DEFAULT_TOP_N))
+            return results
+
+        except Exception as e:
+            logging.error(f"Error in hybrid recommendations: {e}")
+            raise
+
+    def _resolve_weights(self, weights):
+        """Return the weights for one call; request weights override the defaults for that call only."""
+        weights = {**{name: 0.0 for name in self.OPTIONAL_SOURCES}, **(weights or self.weights)}
+        if not all(k in weights for k in self.SOURCES) or not abs(sum(weights.values()) - 1.0) < 1e-6:
+            raise ValueError("Weights must include 'item_based', 'user_based', 'content_based' and sum to 1.")
+        unavailable = [name for name in self.SOURCES if weights[name] > 0 and name not in self.enabled_sources()]
+        if unavailable:
+            raise ValueError(f"Weighted sources are not enabled: {unavailable}")
+        return weights
+
+    def _resolve_members(self, request):
+        """Return the members to score separately, or None when the group is scored as a union."""
+        aggregation = request.get('aggregation') or 'union'
+        if aggregation not in self.AGGREGATIONS:
+            raise ValueError(f"Aggregation must be one of {list(self.AGGREGATIONS)}, got {aggregation!r}")
+        if aggregation == 'union' or not request.get('members'):
+            return None
+        # Members who watched nothing have no scores and would zero out least-misery
+        return [(watched, user_ids) for watched, user_ids in request['members'] if len(watched)] or None
+
+    def _score_pending(self, requests, pending, pools):
+        """Run every source once over all pending requests and fuse each request's pool."""
+        # Sources rank best-first, so one call at the largest depth serves every request
+        depth = max(requests[i].get('top_n', Config.DEFAULT_TOP_N) for i, _, _, _ in pending) * 3
+        # One scoring row per request, or per member when the request aggregates members
+        rows, watched_sets, user_id_sets = [], [], []
+        for i, _, _, members in pending:
+            scored = members if members is not None else [(requests[i]['watched_movies'], requests[i]['user_ids'])]
+            rows.append(range(len(watched_sets), len(watched_sets) + len(scored)))
+            watched_sets.extend(watched for watched, _ in scored)
+            user_id_sets.extend(user_ids for _, user_ids in scored)
+        functions = self.source_functions()
+        if not functions:
+            # Nothing loaded yet: serve popular movies, uncached, until the first source is ready
+            for i, _, _, _ in pending:
+                pools[i] = self._servable(self._popular_pool(requests[i].get('top_n', Config.DEFAULT_TOP_N)))
+            return
+        # Weights of sources still loading are spread over the ready ones
+        ready_weights = [self._ready_weights(weights, functions) for _, _, weights, _ in pending]
+        used = [name for name in self.SOURCES if any(weights[name] > 0 for weights in ready_weights)]
+        # User-based scoring samples seed users; a child of the recommender's RNG keeps seeded runs reproducible
+        with self._rng_lock:
+            user_based_rng = self.rng.spawn(1)[0]
+        source_args = {
+            'item_based': (watched_sets, depth),
+            'user_based': (user_id_sets, depth, Config.USER_BASED_NEIGHBOURS, Config.USER_BASED_MAX_SEED_USERS,
+                           user_based_rng),
+            'content_based': (watched_sets, depth),
+            'matrix_factorization': (watched_sets, depth),
+        }
+
+        # Parallel retrieval of recommendations on the shared executor
+        source_results = self.executor.run([(name, functions[name], source_args[name]) for name in used])
+        if not source_results:
+            # Every source timed out or failed: serve popular movies, uncached, rather than nothing
+            logging.warning("No recommendation source answered, serving popular movies")
+            for i, _, _, _ in pending:
+                pools[i] = self._servable(self._popular_pool(requests[i].get('top_n', Config.DEFAULT_TOP_N)))
+            return
+
+        with STAGE_SECONDS.time(stage='fusion'):
+            for (i, cache_key, weights, members), request_rows, ready in zip(pending, rows, ready_weights):
+                top_n = requests[i].get('top_n', Config.DEFAULT_TOP_N)
+                ranked_lists = [
+                    [(source_results[name][row][0][:top_n * 3], source_results[name][row][1][:top_n * 3], ready[name])
+                     for name in self.SOURCES if name in source_results]
+                    for row in request_rows
+                ]
+                if members is None:
+                    pool = fuse(ranked_lists[0], requests[i]['watched_movies'], self.fusion, Config.FUSION_RRF_K)
                 else:
-                    # Fallback: select top 3*top_n movies by movieId if no rating column
-                    logging.warning("No 'rating' column in movies_df, using uniform weights")
-                    popular_movies = self.movies_df.sort_values(by='movieId').head(top_n * 3)
-                    movie_ids = popular_movies['movieId'].tolist()
-                    weights = [1.0] * len(movie_ids)  # Uniform weights
+                    candidate_ids, member_scores = member_matrix(
+                        ranked_lists, requests[i]['watched_movies'], self.fusion, Config.FUSION_RRF_K)
+                    pool = CandidatePool(candidate_ids, aggregate(member_scores, requests[i]['aggregation'], top_n))
+                pools[i] = self._servable(pool)
+                POOL_SIZE.observe(pools[i].movie_ids.size, kind='fused' if members is None else 'aggregated')
+                # A pool missing a weighted source (timed out or still loading) is served but not cached
+                if all(name in source_results for name in self.SOURCES if weights[name] > 0):
+                    self.result_cache.put(cache_key, pools[i])
 
-                movie_weight_pairs = list(zip(movie_ids, weights))
+    @staticmethod
+    def _ready_weights(weights, ready):
+        """Renormalize ``weights`` over the ``ready`` sources so they still sum to 1.
 
-            # Perform weighted random sampling
-            if not movie_weight_pairs:
-                logging.warning("No valid movies available for recommendation after filtering.")
-                return []
+        When none of the weighted sources is ready, the ready ones share the weight equally.
+        """
+        total = sum(weights[name] for name in ready)
+        if total <= 0:
+            return {name: 1.0 / len(ready) if name in ready else 0.0 for name in weights}
+        return {name: weights[name] / total if name in ready else 0.0 for name in weights}
 
-            movie_ids, weights = zip(*movie_weight_pairs) if movie_weight_pairs else ([], [])
-            recommended_ids = random.choices(
-                movie_ids,
-                weights=weights,
-                k=min(top_n, len(movie_ids))  # Ensure we don't sample more than available
-            )
+    def _popular_pool(self, top_n, genre=None):
+        """Build the candidate pool of popular movies for an empty watch history."""
+        logging.debug("watched_movies is empty, selecting popular movies")
 
-            # Remove duplicates while preserving order using dict.fromkeys
-            recommended_ids = list(dict.fromkeys(recommended_ids))
+        # Select top 3*top_n movies from the precomputed popularity ranking
+        if self.popularity_model is not None:
+            movie_ids, popularity = self.popularity_model.top(top_n * 3, genre)
+            return CandidatePool(np.asarray(movie_ids, dtype=np.int64), np.asarray(popularity, dtype=np.float64))
 
-            # Filter and format the result, selecting db_id as movieId
-            filtered_df = self.movies_df[
-                self.movies_df['movieId'].isin(recommended_ids)
-            ][['db_id']].dropna(subset=['db_id']).rename(columns={'db_id': 'movieId'})
+        # Fallback: select top 3*top_n movies by movieId if no popularity model was given
+        logging.warning("No popularity model, using uniform weights")
+        movie_ids = np.sort(self.movies_df['movieId'].to_numpy(dtype=np.int64))[:top_n * 3]
+        return CandidatePool(movie_ids, np.ones(len(movie_ids)))  # Uniform weights
 
-            return filtered_df.to_dict('records')
+    def _servable(self, pool):
+        """Drop movies without a db_id up front, so sampling never picks one it cannot return."""
+        keep = self.movie_index.can_serve(pool.movie_ids)
+        return pool if keep.all() else CandidatePool(pool.movie_ids[keep], pool.weights[keep])
 
-        except Exception as e:
-            logging.error(f"Error in hybrid recommendations: {e}")
-            raise
\ No newline at end of file
+    def _sample(self, pool, top_n):
+        """Draw ``top_n`` distinct movies of the pool by weight, formatted as db_id records."""
+        if not pool.movie_ids.size:
+            logging.warning("No valid movies available for recommendation after filtering.")
+            return []
+
+        with self._rng_lock:
+            uniform = self.rng.random(pool.movie_ids.size)
+        chosen = sample_without_replacement(pool.weights, top_n, uniform)
+
+        # Format the result in sampling order, translating movieId to db_id
+        return [{'movieId': int(db_id)} for db_id in self.movie_index.to_db_ids(pool.movie_ids[chosen])]
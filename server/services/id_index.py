@@ -0,0 +1,69 @@
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+MISSING = -1
+
+def _dense_lookup(keys, values):
+    """Build an array indexed by ``keys`` holding ``values``, with MISSING elsewhere."""
+    size = int(keys.max()) + 1 if len(keys) else 0
+    table = np.full(size, MISSING, dtype=np.int64)
+    table[keys] = values
+    return table
+
+def _translate(table, ids):
+    ids = np.asarray(ids, dtype=np.int64).ravel()
+    in_range = (ids >= 0) & (ids < len(table))
+    translated = np.full(len(ids), MISSING, dtype=np.int64)
+    translated[in_range] = table[ids[in_range]]
+    return translated
+
+class MovieIdIndex:
+    """Dense movieId <-> db_id translation tables built once from the movies table.
+
+    Both directions are plain arrays indexed by id, so translating a list of ids is an
+    O(len(ids)) gather that keeps the input order.
+    """
+
+    def __init__(self, movie_ids, db_ids):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        db_ids = np.asarray(db_ids, dtype=np.float64)
+        has_db_id = ~np.isnan(db_ids)
+
+        self.movie_to_db = _dense_lookup(movie_ids[has_db_id], db_ids[has_db_id].astype(np.int64))
+        self.db_to_movie = _dense_lookup(db_ids[has_db_id].astype(np.int64), movie_ids[has_db_id])
+        self.known_movies = np.zeros(int(movie_ids.max()) + 1 if len(movie_ids) else 0, dtype=bool)
+        self.known_movies[movie_ids] = True
+
+    @classmethod
+    def from_movies(cls, movies_df):
+        index = cls(movies_df['movieId'].to_numpy(), movies_df['db_id'].to_numpy(dtype=np.float64))
+        logging.info(f"Movie id index built for {len(movies_df)} movies")
+        return index
+
+    def to_movie_ids(self, db_ids):
+        """Translate db_ids to movieIds in order, dropping db_ids that are not in the catalog."""
+        movie_ids = _translate(self.db_to_movie, db_ids)
+        return movie_ids[movie_ids != MISSING]
+
+    def to_db_ids(self, movie_ids):
+        """Translate movieIds to db_ids in order, dropping movies without a db_id."""
+        db_ids = _translate(self.movie_to_db, movie_ids)
+        return db_ids[db_ids != MISSING]
+
+    def can_serve(self, movie_ids):
+        """Boolean mask of which movieIds have a db_id, i.e. can be returned to clients."""
+        return _translate(self.movie_to_db, movie_ids) != MISSING
+
+    def has_db_ids(self, db_ids):
+        """Boolean mask of which db_ids belong to catalog movies."""
+        return _translate(self.db_to_movie, db_ids) != MISSING
+
+    def has_movies(self, movie_ids):
+        """Boolean mask of which movieIds are in the catalog."""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64).ravel()
+        in_range = (movie_ids >= 0) & (movie_ids < len(self.known_movies))
+        known = np.zeros(len(movie_ids), dtype=bool)
+        known[in_range] = self.known_movies[movie_ids[in_range]]
+        return known
@@ -0,0 +1,40 @@
+import numpy as np
+from services.lazy import resolve
+from services.metrics import INGEST_SECONDS, INGESTED_RATINGS
+from services.model_store import ModelSnapshot
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+def ingest_ratings(model_store, user_ids, movie_ids, ratings):
+    """Apply a batch of (userId, movieId, rating) events and publish a new model snapshot.
+
+    The sparse ratings, item/user norms, the affected neighbour lists and the raters of
+    touched movies are updated incrementally; requests keep being served from the
+    previous snapshot until the new one is swapped in.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    if not (len(user_ids) == len(movie_ids) == len(ratings)):
+        raise ValueError("userId, movieId and rating batches must have the same length")
+
+    with model_store.write_lock, INGEST_SECONDS.time():
+        try:
+            current = model_store.current
+            recommender = current.recommender
+            # Ratings update the collaborative model, so it has to be loaded first
+            collaborative_filter = resolve(recommender.collaborative_filter).with_ratings(user_ids, movie_ids, ratings)
+            user_item_matrix = collaborative_filter.user_item_matrix
+            snapshot = ModelSnapshot(
+                recommender.with_collaborative_filter(collaborative_filter),
+                current.raters_index.updated(user_item_matrix, user_item_matrix.movie_positions(movie_ids)),
+                version=current.version + 1,
+            )
+            model_store.swap(snapshot)
+            INGESTED_RATINGS.inc(len(ratings))
+            logging.info(f"Ingested {len(ratings)} ratings into snapshot {snapshot.version}")
+            return snapshot
+        except Exception as e:
+            logging.error(f"Error ingesting ratings: {e}")
+            raise
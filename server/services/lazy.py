@@ -0,0 +1,78 @@
+import functools
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+class NotReadyError(RuntimeError):
+    """A lazily loaded model did not finish loading within the caller's timeout."""
+
+class LazyModel:
+    """A model loaded once, in a background thread, on first use or by an explicit warm-up.
+
+    ``status()`` is 'cold' until loading starts, then 'loading' and finally 'ready' or
+    'failed'. :meth:`peek` never blocks, so request threads can serve from whatever is
+    already loaded; :meth:`get` waits and re-raises the load error, if any.
+    """
+
+    def __init__(self, name, load, *args, **kwargs):
+        self.name = name
+        self._load = functools.partial(load, *args, **kwargs)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._value = None
+        self._error = None
+
+    def start(self):
+        """Start loading in the background unless it already started; returns self."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'load-{self.name}', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._value = self._load()
+        except Exception as e:
+            logging.error(f"Failed to load {self.name}: {e}")
+            self._error = e
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self._error is None
+
+    def status(self):
+        if self._done.is_set():
+            return 'failed' if self._error is not None else 'ready'
+        return 'cold' if self._thread is None else 'loading'
+
+    def peek(self):
+        """Return the model if it is loaded, otherwise start loading it and return None."""
+        if self.ready:
+            return self._value
+        self.start()
+        return None
+
+    def get(self, timeout=None):
+        """Return the model, loading it first if needed; NotReadyError after ``timeout`` seconds."""
+        self.start()
+        if not self._done.wait(timeout):
+            raise NotReadyError(f"{self.name} is still loading")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+# Helpers accepting either a LazyModel or an already loaded model (or None for a disabled one)
+
+def peek(model):
+    return model.peek() if isinstance(model, LazyModel) else model
+
+def resolve(model, timeout=None):
+    return model.get(timeout) if isinstance(model, LazyModel) else model
+
+def model_status(model):
+    return model.status() if isinstance(model, LazyModel) else 'ready'
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from services.artifacts import artifact_metadata, data_fingerprint, load_artifact, save_artifact
+from services import scoring
+from services.user_item_matrix import lookup_positions
+import logging
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+class MatrixFactorization:
+    """Latent-factor model of the rating matrix trained with alternating least squares.
+
+    Ratings are approximated by ``user_factors @ item_factors.T`` with float32 factor
+    matrices of ``factors`` columns, so the model takes O((users + movies) x factors)
+    memory. A watched set is folded in as a pseudo-user whose factor vector is solved
+    against the item factors, and its scores for every movie are one matrix-vector product.
+    """
+
+    def __init__(self, user_item_matrix, cache_dir=Config.CACHE_DIR, fingerprint=None,
+                 factors=Config.MF_FACTORS, regularization=Config.MF_REGULARIZATION,
+                 iterations=Config.MF_ITERATIONS, build=True):
+        self.user_item_matrix = user_item_matrix
+        self.movie_ids = user_item_matrix.movie_ids
+        self._movie_sorter = np.argsort(self.movie_ids, kind='stable')
+        self.cache_dir = Path(cache_dir)
+        self.fingerprint = fingerprint
+        self.factors = factors
+        self.regularization = regularization
+        self.iterations = iterations
+        # Without build, prebuilt factors are loaded as they are and never retrained
+        self.allow_build = build
+        self.user_factors = None
+        self.item_factors = None
+        self._initialize()
+
+    def _initialize(self):
+        """Load the factor matrices from cache or train them."""
+        try:
+            metadata = self._cache_metadata() if self.allow_build else None
+            artifact = load_artifact(self.cache_dir / 'matrix_factorization', expected=metadata)
+            if artifact is not None:
+                logging.info("Loading matrix factorization from cache")
+                arrays, _ = artifact
+                self.user_factors, self.item_factors = arrays['user_factors'], arrays['item_factors']
+                return
+            if not self.allow_build:
+                raise FileNotFoundError(f"Matrix factorization missing in {self.cache_dir}; run build_models.py")
+
+            logging.info("Training matrix factorization")
+            self.user_factors, self.item_factors = self._train()
+            save_artifact(self.cache_dir / 'matrix_factorization', {
+                'user_factors': self.user_factors,
+                'item_factors': self.item_factors,
+            }, metadata)
+            logging.info("Matrix factorization saved to cache")
+
+        except Exception as e:
+            logging.error(f"Error initializing matrix factorization: {e}")
+            raise
+
+    def _cache_metadata(self):
+        """Describe the inputs and parameters the cached factors are built from."""
+        fingerprint = self.fingerprint
+        if fingerprint is None:
+            matrix = self.user_item_matrix
+            fingerprint = data_fingerprint(matrix.user_ids, matrix.movie_ids, matrix.matrix.indptr,
+                                           matrix.matrix.indices, matrix.matrix.data)
+        params = {'factors': self.factors, 'regularization': self.regularization, 'iterations': self.iterations}
+        return artifact_metadata({'ratings': fingerprint}, params)
+
+    def _train(self, block_size=Config.MF_BLOCK_SIZE, n_threads=Config.MF_THREADS, seed=0):
+        """Alternate exact least-squares solves for all users and all movies.
+
+        Each half-step splits the rows into blocks solved concurrently on ``n_threads``
+        threads; NumPy releases the GIL inside the Gram products and the batched solve.
+        """
+        rng = np.random.default_rng(seed)
+        ratings = self.user_item_matrix.matrix
+        ratings_t = self.user_item_matrix.csc.T.tocsr()
+        scale = 1.0 / np.sqrt(self.factors)
+        user_factors = np.zeros((ratings.shape[0], self.factors), dtype=np.float32)
+        item_factors = (rng.standard_normal((ratings.shape[1], self.factors)) * scale).astype(np.float32)
+
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            for iteration in range(self.iterations):
+                self._solve_rows(pool, ratings, item_factors, user_factors, block_size)
+                self._solve_rows(pool, ratings_t, user_factors, item_factors, block_size)
+                logging.info(f"ALS iteration {iteration + 1}/{self.iterations}: "
+                             f"RMSE {self._rmse(ratings, user_factors, item_factors):.4f}")
+        return user_factors, item_factors
+
+    def _solve_rows(self, pool, ratings, fixed, out, block_size):
+        """Solve every row of ``out`` against the ``fixed`` factors, one block per task."""
+        blocks = [(start, min(start + block_size, ratings.shape[0]))
+                  for start in range(0, ratings.shape[0], block_size)]
+        for future in [pool.submit(self._solve_block, ratings, fixed, out, start, end) for start, end in blocks]:
+            future.result()
+
+    def _solve_block(self, ratings, fixed, out, start, end, gather_bytes=Config.MF_GATHER_BYTES):
+        """Weighted-lambda ALS update of rows ``start:end`` of ``out`` in one batched solve.
+
+        Rows are bucketed by their number of ratings (half powers of two) and the gathered
+        factor rows of a bucket, zero-padded to its longest row, go through one stacked
+        matmul for their Gram matrices, in chunks of at most ``gather_bytes``.
+        """
+        indptr, indices = ratings.indptr, ratings.indices
+        counts = np.diff(indptr[start:end + 1])
+        gram = np.zeros((end - start, self.factors, self.factors), dtype=np.float32)
+        buckets = np.ceil(2 * np.log2(np.maximum(counts, 1))).astype(np.int64)
+        for bucket in np.unique(buckets[counts > 0]):
+            bucket_rows = np.flatnonzero((buckets == bucket) & (counts > 0))
+            slots = np.arange(counts[bucket_rows].max())
+            chunk = max(1, gather_bytes // (len(slots) * self.factors * np.dtype(np.float32).itemsize))
+            for rows in np.array_split(bucket_rows, -(-len(bucket_rows) // chunk)):
+                positions = np.minimum(indptr[start + rows][:, None] + slots[None, :], len(indices) - 1)
+                rated = fixed[indices[positions]]
+                rated[slots[None, :] >= counts[rows][:, None]] = 0.0
+                gram[rows] = np.matmul(rated.transpose(0, 2, 1), rated)
+        gram += (self.regularization * np.maximum(counts, 1))[:, None, None] * np.eye(self.factors, dtype=np.float32)
+        rhs = np.asarray(ratings[start:end] @ fixed, dtype=np.float32)
+        out[start:end] = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+    @staticmethod
+    def _rmse(ratings, user_factors, item_factors):
+        """Root mean squared error over the observed ratings."""
+        coo = ratings.tocoo()
+        predicted = np.einsum('ij,ij->i', user_factors[coo.row], item_factors[coo.col])
+        return float(np.sqrt(np.mean((coo.data - predicted) ** 2)))
+
+    def positions(self, movie_ids):
+        """Map movieIds to factor rows; unknown ids map to -1."""
+        return lookup_positions(self.movie_ids, movie_ids, sorter=self._movie_sorter)
+
+    def fold_in(self, watched_sets):
+        """Solve a (n_sets x factors) matrix of pseudo-user factors, one per watched set.
+
+        Watched movies are treated as equally liked; since scores are only ranked, their
+        target rating does not matter and is taken as 1.
+        """
+        queries = np.zeros((len(watched_sets), self.factors), dtype=np.float32)
+        identity = np.eye(self.factors, dtype=np.float32)
+        for set_index, watched in enumerate(watched_sets):
+            positions = self.positions(list(watched))
+            positions = np.unique(positions[positions >= 0])
+            if len(positions) == 0:
+                continue
+            rated = np.asarray(self.item_factors[positions])
+            gram = rated.T @ rated + self.regularization * len(positions) * identity
+            queries[set_index] = np.linalg.solve(gram, rated.sum(axis=0))
+        return queries
+
+    def get_recommendations(self, watched_movies, top_n):
+        """Get matrix-factorization recommendations for watched movies."""
+        movie_ids, _ = self.get_scores([watched_movies], top_n)[0]
+        return pd.Index(movie_ids)
+
+    def get_scores(self, watched_sets, top_n):
+        """Get (movie_ids, scores) for a batch of watched sets with one product over all movies."""
+        try:
+            queries = self.fold_in(watched_sets)
+            score_matrix = queries @ np.asarray(self.item_factors).T
+            results = []
+            for set_index, watched in enumerate(watched_sets):
+                scores = score_matrix[set_index]
+                watched_positions = self.positions(list(watched))
+                scores[watched_positions[watched_positions >= 0]] = 0.0
+                best = scoring.top_n(scores, top_n)
+                best = best[scores[best] > 0]
+                results.append((self.movie_ids[best], scores[best]))
+            return results
+        except Exception as e:
+            logging.error(f"Error in matrix factorization recommendations: {e}")
+            raise
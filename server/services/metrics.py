@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond lookups to multi-second model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base of a labelled metric family; children are keyed by their label values."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, value in children:
+            lines.extend(self._render_child(key, value))
+        return lines
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._children.get(self._key(labels), 0)
+
+    def _render_child(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. a model's load duration or version."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = value
+
+    def value(self, **labels):
+        return self._children.get(self._key(labels))
+
+    def _render_child(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed cumulative buckets, plus their sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._children.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._children[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock seconds spent in the ``with`` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        counts, _ = self._children.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _render_child(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Request path
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'recommender_request_seconds', "End-to-end request latency", ['endpoint', 'status']))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'recommender_stage_seconds', "Latency of one stage of a recommendation request", ['stage']))
+SOURCE_SECONDS = REGISTRY.register(Histogram(
+    'recommender_source_seconds', "Latency of one recommendation source call, queueing included", ['source']))
+SOURCE_FAILURES = REGISTRY.register(Counter(
+    'recommender_source_failures_total', "Source calls left out of a response", ['source', 'reason']))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'recommender_cache_lookups_total', "Candidate pool cache lookups", ['result']))
+POOL_SIZE = REGISTRY.register(Histogram(
+    'recommender_candidate_pool_size', "Movies in a request's candidate pool before sampling", ['kind'],
+    buckets=(0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'recommender_batch_size', "Requests scored together in one micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+
+# Models
+MODEL_LOAD_SECONDS = REGISTRY.register(Gauge(
+    'recommender_model_load_seconds', "Time the serving process spent loading a model", ['model']))
+MODEL_BUILD_SECONDS = REGISTRY.register(Gauge(
+    'recommender_model_build_seconds', "Time the offline build of the served version spent per stage", ['stage']))
+MODEL_VERSION = REGISTRY.register(Gauge(
+    'recommender_model_snapshot_version', "Version of the model snapshot being served"))
+INGESTED_RATINGS = REGISTRY.register(Counter(
+    'recommender_ingested_ratings_total', "Ratings applied through incremental ingestion"))
+INGEST_SECONDS = REGISTRY.register(Histogram(
+    'recommender_ingest_seconds', "Time to apply a batch of ratings and publish a snapshot"))
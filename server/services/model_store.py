@@ -0,0 +1,36 @@
+import threading
+from services.metrics import MODEL_VERSION
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+class ModelSnapshot:
+    """Immutable bundle of everything a recommendation request reads."""
+
+    def __init__(self, recommender, raters_index, version=0):
+        self.recommender = recommender
+        self.raters_index = raters_index
+        self.version = version
+
+class ModelStore:
+    """Holds the current model snapshot and swaps in new ones atomically.
+
+    Readers take ``current`` once per request and use that snapshot throughout, so a
+    concurrent swap never mixes old and new models within one request. Writers build
+    the next snapshot while holding ``write_lock`` so updates are applied in order.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        self.write_lock = threading.Lock()
+        MODEL_VERSION.set(snapshot.version)
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    def swap(self, snapshot):
+        """Publish a new snapshot; rebinding the reference is atomic for concurrent readers."""
+        self._snapshot = snapshot
+        MODEL_VERSION.set(snapshot.version)
+        logging.info(f"Model snapshot {snapshot.version} published")
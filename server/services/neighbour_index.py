@@ -0,0 +1,194 @@
+import numpy as np
+from scipy import sparse
+from config import Config
+from services.artifacts import load_artifact, save_artifact
+from services.scoring import normalize_rows, top_n_per_row
+from services.user_item_matrix import lookup_positions
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+def rows_per_block(block_bytes, n_rows, itemsize=np.dtype(np.float32).itemsize):
+    """Rows of an ``n_rows``-wide dense block that fit in ``block_bytes`` (at least one)."""
+    return max(1, block_bytes // max(n_rows * itemsize, 1))
+
+class NeighbourIndex:
+    """Top-K cosine neighbours for every row of a feature matrix.
+
+    ``neighbours[i]`` holds row positions (int32) of the K most similar rows to row i,
+    ordered by decreasing similarity, and ``scores[i]`` the matching float32 cosines.
+    Slots without a positive similarity point back at row i with a 0.0 score, which keeps
+    every row exactly K wide so the arrays double as a CSR matrix without copying.
+    """
+
+    def __init__(self, ids, neighbours, scores, sorter=None):
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.neighbours = np.asarray(neighbours, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self._sorter = np.argsort(self.ids, kind='stable') if sorter is None else np.asarray(sorter)
+        self._matrix = None
+
+    @classmethod
+    def build(cls, matrix, ids, k=Config.NEIGHBOUR_K, block_bytes=Config.NEIGHBOUR_BLOCK_BYTES):
+        """Compute the index block by block so the full similarity matrix never exists at once.
+
+        Each dense block of similarities is ``block_size x n_rows`` float32, so the block
+        size is derived from ``block_bytes`` and shrinks as the number of rows grows.
+        """
+        rows = normalize_rows(sparse.csr_matrix(matrix, dtype=np.float32))
+        rows_t = rows.T.tocsc()
+        n_rows = rows.shape[0]
+        k = max(min(k, n_rows - 1), 0)
+        block_size = rows_per_block(block_bytes, n_rows)
+
+        neighbours = np.repeat(np.arange(n_rows, dtype=np.int32)[:, None], k, axis=1)
+        scores = np.zeros((n_rows, k), dtype=np.float32)
+        if k == 0:
+            return cls(ids, neighbours, scores)
+
+        for start in range(0, n_rows, block_size):
+            end = min(start + block_size, n_rows)
+            block = (rows[start:end] @ rows_t).toarray()
+            # A row is never its own neighbour
+            block[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+            # The k largest, partitioned in place of a negated copy of the block
+            top = np.argpartition(block, n_rows - k, axis=1)[:, n_rows - k:]
+            neighbours[start:end], scores[start:end] = cls._select_top(
+                top, np.take_along_axis(block, top, axis=1), k, rows=np.arange(start, end))
+
+        logging.info(f"Neighbour index built: {n_rows} rows, k={k}")
+        return cls(ids, neighbours, scores)
+
+    def updated(self, matrix, norms, ids, touched, block_size=Config.NEIGHBOUR_UPDATE_BLOCK_SIZE,
+                block_bytes=Config.NEIGHBOUR_BLOCK_BYTES):
+        """Return a new index reflecting changed rows of ``matrix`` without a full rebuild.
+
+        ``norms`` are the L2 norms of the rows of ``matrix`` and ``touched`` the positions of
+        rows that changed or were appended. Touched rows get exact new neighbour lists; every
+        other row drops its entries pointing at touched rows and merges in their fresh
+        similarities. A row whose neighbour lost similarity may keep fewer than K entries
+        until the next full build.
+        """
+        matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        n_rows, k = matrix.shape[0], self.k
+        touched = np.unique(np.asarray(touched, dtype=np.int32))
+        block_size = min(block_size, rows_per_block(block_bytes, n_rows))
+
+        neighbours = np.repeat(np.arange(n_rows, dtype=np.int32)[:, None], k, axis=1)
+        scores = np.zeros((n_rows, k), dtype=np.float32)
+        neighbours[:len(self.ids)] = self.neighbours
+        scores[:len(self.ids)] = self.scores
+        if k == 0 or len(touched) == 0:
+            return NeighbourIndex(ids, neighbours, scores)
+
+        # Entries pointing at touched rows are stale wherever they appear
+        is_touched = np.zeros(n_rows, dtype=bool)
+        is_touched[touched] = True
+        stale = is_touched[neighbours]
+        scores[stale] = 0.0
+        neighbours[stale] = np.broadcast_to(np.arange(n_rows, dtype=np.int32)[:, None], neighbours.shape)[stale]
+
+        inverse_norms = np.divide(1.0, norms, out=np.zeros(n_rows, dtype=np.float32), where=norms > 0)
+        matrix_t = matrix.T.tocsc()
+        for start in range(0, len(touched), block_size):
+            block_rows = touched[start:start + block_size]
+            similarities = (matrix[block_rows] @ matrix_t).toarray()
+            similarities *= inverse_norms[block_rows][:, None] * inverse_norms[None, :]
+            similarities[np.arange(len(block_rows)), block_rows] = 0.0
+
+            # Touched rows get an exact list from their similarity row
+            top = np.argpartition(similarities, n_rows - k, axis=1)[:, n_rows - k:]
+            neighbours[block_rows], scores[block_rows] = self._select_top(
+                top, np.take_along_axis(similarities, top, axis=1), k, rows=block_rows)
+
+            # Other rows similar to a touched row merge the fresh scores into their list
+            affected = np.flatnonzero((similarities > 0).any(axis=0) & ~is_touched)
+            if len(affected):
+                candidates = np.hstack([neighbours[affected],
+                                        np.broadcast_to(block_rows, (len(affected), len(block_rows)))])
+                candidate_scores = np.hstack([scores[affected], similarities[:, affected].T])
+                neighbours[affected], scores[affected] = self._select_top(
+                    candidates, candidate_scores, k, rows=affected)
+
+        logging.info(f"Neighbour index updated: {len(touched)} of {n_rows} rows touched")
+        return NeighbourIndex(ids, neighbours, scores)
+
+    @staticmethod
+    def _select_top(candidates, candidate_scores, k, rows=None):
+        """Keep the k best positive candidates per row, best first, padding with self-references."""
+        rows = np.arange(len(candidates)) if rows is None else np.asarray(rows)
+        top = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(candidate_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top = np.take_along_axis(np.take_along_axis(candidates, top, axis=1), order, axis=1)
+        positive = top_scores > 0
+        return (np.where(positive, top, rows[:, None]).astype(np.int32),
+                np.where(positive, top_scores, 0.0).astype(np.float32))
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return lookup_positions(self.ids, [item_id], sorter=self._sorter)[0] >= 0
+
+    def positions(self, item_ids):
+        """Map ids to row positions; unknown ids map to -1."""
+        return lookup_positions(self.ids, item_ids, sorter=self._sorter)
+
+    def as_sparse(self):
+        """Return the index as a sparse (n x n) CSR similarity matrix sharing the index buffers."""
+        if self._matrix is None:
+            n_rows = len(self.ids)
+            indptr = np.arange(n_rows + 1, dtype=np.int64) * self.k
+            self._matrix = sparse.csr_matrix(
+                (self.scores.reshape(-1), self.neighbours.reshape(-1), indptr),
+                shape=(n_rows, n_rows),
+                copy=False,
+            )
+        return self._matrix
+
+    def save(self, directory, metadata=None):
+        """Persist the index as a memory-mappable artifact."""
+        save_artifact(directory, {
+            'ids': self.ids,
+            'neighbours': self.neighbours,
+            'scores': self.scores,
+            'sorter': self._sorter,
+        }, metadata)
+
+    @classmethod
+    def load(cls, directory, mmap=True, expected=None):
+        """Open an index saved with :meth:`save`; returns None if it is missing or stale."""
+        artifact = load_artifact(directory, mmap=mmap, expected=expected)
+        if artifact is None:
+            return None
+        arrays, _ = artifact
+        return cls(arrays['ids'], arrays['neighbours'], arrays['scores'], sorter=arrays['sorter'])
+
+    def top_similar(self, watched_sets, top_n):
+        """Score a batch of watched sets and return each set's top-N (ids, scores), best first.
+
+        Every set's score vector is the sum of its members' neighbour rows, computed for the
+        whole batch as one sparse product; members of a set are never recommended back to it.
+        """
+        watched_positions = [self.positions(list(watched)) for watched in watched_sets]
+        watched_positions = [np.unique(positions[positions >= 0]) for positions in watched_positions]
+
+        rows = np.repeat(np.arange(len(watched_positions)), [len(p) for p in watched_positions])
+        columns = np.concatenate(watched_positions) if watched_positions else np.empty(0, dtype=np.int32)
+        selection = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), (rows, columns)),
+            shape=(len(watched_positions), len(self.ids)),
+        )
+        score_matrix = (selection @ self.as_sparse()).tocsr()
+
+        return [
+            (self.ids[positions], scores)
+            for positions, scores in top_n_per_row(score_matrix, top_n, exclude=watched_positions)
+        ]
@@ -0,0 +1,192 @@
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from config import Config
+from services.artifacts import (artifact_metadata, current_version_dir, new_build_dir, prune_versions,
+                                publish_version)
+from services.collaborative_filtering import CollaborativeFilter
+from services.content_based import ContentBasedFilter
+from services.data_loader import DataLoader
+from services.lazy import LazyModel
+from services.matrix_factorization import MatrixFactorization
+from services.metrics import MODEL_BUILD_SECONDS, MODEL_LOAD_SECONDS
+from services.popularity import PopularityModel
+from services.raters_index import RatersIndex
+from services.user_item_matrix import UserItemMatrix
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+# Layout of a published version directory, besides the per-model artifacts
+MOVIES_NAME = 'movies.parquet'
+USER_ITEM_MATRIX_NAME = 'user_item_matrix'
+POPULARITY_NAME = 'popularity'
+BUILD_INFO_NAME = 'build.json'
+
+# Loaded data shared with the forked stage workers
+_build_context = {}
+
+def _build_content(data_loader, build_dir):
+    ContentBasedFilter(data_loader.movies_df, cache_dir=build_dir, fingerprint=data_loader.fingerprints['movies'])
+
+def _build_collaborative(data_loader, build_dir):
+    CollaborativeFilter(data_loader.user_item_matrix, cache_dir=build_dir,
+                        fingerprint=data_loader.fingerprints['ratings'])
+
+def _build_popularity(data_loader, build_dir):
+    metadata = artifact_metadata(
+        {'movies': data_loader.fingerprints['movies'], 'ratings': data_loader.fingerprints['ratings']},
+        {'min_votes_quantile': Config.POPULARITY_MIN_VOTES_QUANTILE},
+    )
+    if PopularityModel.load(build_dir / POPULARITY_NAME, expected=metadata) is None:
+        PopularityModel.from_ratings(data_loader.ratings_df, data_loader.movies_df).save(
+            build_dir / POPULARITY_NAME, metadata)
+
+def _build_matrix_factorization(data_loader, build_dir):
+    MatrixFactorization(data_loader.user_item_matrix, cache_dir=build_dir,
+                        fingerprint=data_loader.fingerprints['ratings'])
+
+STAGES = {
+    'content': _build_content,
+    'collaborative': _build_collaborative,
+    'popularity': _build_popularity,
+    'matrix_factorization': _build_matrix_factorization,
+}
+
+def _run_stage(name):
+    """Run one model stage in a worker forked after the data was loaded."""
+    start = time.perf_counter()
+    STAGES[name](_build_context['data_loader'], _build_context['build_dir'])
+    return name, time.perf_counter() - start
+
+def _seed_from_current(root, build_dir):
+    """Hard-link the artifacts of the published version into the build so fresh ones are reused."""
+    try:
+        current = current_version_dir(root)
+    except FileNotFoundError:
+        return
+    for source in current.iterdir():
+        if source.is_dir():
+            shutil.copytree(source, build_dir / source.name, copy_function=os.link)
+    logging.info(f"Seeded build from version {current.name}; only stale artifacts are rebuilt")
+
+def build_version(movies_path=Config.MOVIES_PATH, ratings_path=Config.RATINGS_PATH, root=Config.ARTIFACTS_DIR,
+                  workers=Config.BUILD_WORKERS, reuse=True, keep=Config.ARTIFACTS_KEEP):
+    """Build every model artifact into a new version directory and publish it.
+
+    Stages:
+      1. load     read movies and ratings and build the sparse user-item matrix
+      2. models   content, collaborative, popularity and, when enabled, matrix
+                  factorization, each in its own process forked after the load stage
+      3. publish  rename the finished build to its version and repoint ``CURRENT``
+
+    Nothing is published if any stage fails. Returns the published version directory.
+    """
+    build_dir = new_build_dir(root)
+    try:
+        if reuse:
+            _seed_from_current(root, build_dir)
+
+        start = time.perf_counter()
+        data_loader = DataLoader(movies_path, ratings_path)
+        data_loader.load_data()
+        data_loader.read_movies().to_parquet(build_dir / MOVIES_NAME, index=False)
+        data_loader.user_item_matrix.save(
+            build_dir / USER_ITEM_MATRIX_NAME,
+            artifact_metadata({'ratings': data_loader.fingerprints['ratings']}, {}),
+        )
+        durations = {'load': time.perf_counter() - start}
+        logging.info(f"Stage 'load' finished in {durations['load']:.1f}s")
+
+        stages = [name for name in STAGES if name != 'matrix_factorization' or Config.MF_ENABLED]
+        _build_context.update(data_loader=data_loader, build_dir=build_dir)
+        with ProcessPoolExecutor(max_workers=max(min(workers, len(stages)), 1),
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            for name, seconds in pool.map(_run_stage, stages):
+                durations[name] = seconds
+                logging.info(f"Stage '{name}' finished in {seconds:.1f}s")
+
+        # Stage durations are exported by the server that loads this version
+        with open(build_dir / BUILD_INFO_NAME, 'w') as f:
+            json.dump({'stage_seconds': durations}, f, indent=2)
+        version_dir = publish_version(root, build_dir)
+        prune_versions(root, keep)
+        return version_dir
+
+    except Exception as e:
+        logging.error(f"Model build failed, nothing published: {e}")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    finally:
+        _build_context.clear()
+
+class PublishedModels:
+    """Every model of one published artifacts version, opened read-only without rebuilding.
+
+    The movies, user-item matrix, popularity model and raters index every request needs
+    are opened here. The recommendation sources (content, collaborative and, when
+    enabled, matrix factorization) are LazyModels that load on first use or on
+    :meth:`warm_up`. Raises FileNotFoundError when the version or one of the core
+    artifacts is missing, so a server started before the first build fails at once
+    instead of computing models; a missing source artifact fails that source only.
+    """
+
+    def __init__(self, version_dir):
+        self.version_dir = Path(version_dir)
+        self.data_loader = DataLoader(movies_path=self.version_dir / MOVIES_NAME)
+        self.movies_df = self._timed('movies', self.data_loader.load_movies)
+
+        self.user_item_matrix = self._timed('user_item_matrix', UserItemMatrix.load,
+                                            self.version_dir / USER_ITEM_MATRIX_NAME)
+        self.popularity_model = self._timed('popularity', PopularityModel.load, self.version_dir / POPULARITY_NAME)
+        if self.user_item_matrix is None or self.popularity_model is None:
+            raise FileNotFoundError(f"Incomplete model artifacts in {self.version_dir}; run build_models.py")
+
+        self.content_filter = LazyModel('content', self._timed, 'content', ContentBasedFilter, self.movies_df,
+                                        cache_dir=self.version_dir, build=False)
+        self.collaborative_filter = LazyModel('collaborative', self._timed, 'collaborative', CollaborativeFilter,
+                                              self.user_item_matrix, cache_dir=self.version_dir, build=False)
+        self.matrix_factorization = None
+        if Config.MF_ENABLED:
+            self.matrix_factorization = LazyModel('matrix_factorization', self._timed, 'matrix_factorization',
+                                                  MatrixFactorization, self.user_item_matrix,
+                                                  cache_dir=self.version_dir, build=False)
+        self.raters_index = self._timed('raters_index', RatersIndex.from_user_item_matrix, self.user_item_matrix)
+        self._export_build_info()
+        logging.info(f"Loaded model artifacts version {self.version_dir.name}")
+
+    @property
+    def sources(self):
+        return [model for model in (self.content_filter, self.collaborative_filter, self.matrix_factorization)
+                if model is not None]
+
+    def warm_up(self, wait=False):
+        """Start loading every source in the background; with ``wait``, block until all are
+        loaded and raise the first load error."""
+        for model in self.sources:
+            model.start()
+        if wait:
+            for model in self.sources:
+                model.get()
+        return self
+
+    @staticmethod
+    def _timed(model, load, *args, **kwargs):
+        start = time.perf_counter()
+        result = load(*args, **kwargs)
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model)
+        return result
+
+    def _export_build_info(self):
+        try:
+            with open(self.version_dir / BUILD_INFO_NAME) as f:
+                stage_seconds = json.load(f)['stage_seconds']
+        except (OSError, ValueError, KeyError):
+            # Versions built before build.json existed
+            return
+        for stage, seconds in stage_seconds.items():
+            MODEL_BUILD_SECONDS.set(seconds, stage=stage)
@@ -0,0 +1,80 @@
+import numpy as np
+from config import Config
+from services.artifacts import load_artifact, save_artifact
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+# MovieLens placeholder for movies without genres
+NO_GENRES = '(no genres listed)'
+
+class PopularityModel:
+    """Movies presorted by Bayesian-average rating for the empty-watch-history path.
+
+    The Bayesian average shrinks a movie's mean rating towards the global mean by
+    ``min_votes`` phantom votes, so a handful of perfect ratings does not outrank a
+    well-liked classic: ``(v * R + m * C) / (v + m)``.
+    """
+
+    def __init__(self, movie_ids, scores, counts, genre_rankings=None):
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.counts = np.asarray(counts, dtype=np.int32)
+        # genre -> positions into the ranking above, already in rank order
+        self.genre_rankings = genre_rankings or {}
+
+    @classmethod
+    def from_ratings(cls, ratings_df, movies_df, min_votes_quantile=Config.POPULARITY_MIN_VOTES_QUANTILE):
+        """Compute the ranking once from the ratings table, restricted to catalog movies."""
+        stats = ratings_df.groupby('movieId')['rating'].agg(['mean', 'count'])
+        stats = stats[stats.index.isin(movies_df['movieId'])]
+        if stats.empty:
+            return cls([], [], [])
+
+        global_mean = np.average(stats['mean'], weights=stats['count'])
+        min_votes = stats['count'].quantile(min_votes_quantile)
+        scores = (stats['count'] * stats['mean'] + min_votes * global_mean) / (stats['count'] + min_votes)
+        order = np.argsort(-scores.to_numpy(), kind='stable')
+        movie_ids = stats.index.to_numpy()[order]
+
+        genres = movies_df.set_index('movieId')['genres'].astype(object).reindex(movie_ids).fillna('')
+        genre_rankings = {}
+        for position, movie_genres in enumerate(genres.str.split('|')):
+            for genre in movie_genres:
+                if not genre or genre == NO_GENRES:
+                    continue
+                genre_rankings.setdefault(genre.lower(), []).append(position)
+        genre_rankings = {genre: np.asarray(positions, dtype=np.int32) for genre, positions in genre_rankings.items()}
+
+        logging.info(f"Popularity ranking built for {len(movie_ids)} movies (min votes {min_votes:.1f})")
+        return cls(movie_ids, scores.to_numpy()[order], stats['count'].to_numpy()[order], genre_rankings)
+
+    def save(self, directory, metadata=None):
+        """Persist the ranking; genre rankings are stored as one CSR-style positions array."""
+        genres = sorted(self.genre_rankings)
+        positions = [self.genre_rankings[genre] for genre in genres]
+        save_artifact(directory, {
+            'movie_ids': self.movie_ids,
+            'scores': self.scores,
+            'counts': self.counts,
+            'genre_indptr': np.concatenate([[0], np.cumsum([len(p) for p in positions])]).astype(np.int64),
+            'genre_positions': np.concatenate(positions) if positions else np.empty(0, dtype=np.int32),
+        }, {**(metadata or {}), 'genres': genres})
+
+    @classmethod
+    def load(cls, directory, mmap=True, expected=None):
+        """Open a ranking saved with :meth:`save`; returns None if it is missing or stale."""
+        artifact = load_artifact(directory, mmap=mmap, expected=expected)
+        if artifact is None:
+            return None
+        arrays, metadata = artifact
+        indptr, positions = arrays['genre_indptr'], arrays['genre_positions']
+        genre_rankings = {genre: positions[indptr[i]:indptr[i + 1]] for i, genre in enumerate(metadata['genres'])}
+        return cls(arrays['movie_ids'], arrays['scores'], arrays['counts'], genre_rankings)
+
+    def top(self, n, genre=None):
+        """Return the ``n`` most popular (movie_ids, scores), optionally within one genre."""
+        if genre is None:
+            return self.movie_ids[:n], self.scores[:n]
+        positions = self.genre_rankings.get(genre.lower(), np.empty(0, dtype=np.int32))[:n]
+        return self.movie_ids[positions], self.scores[positions]
@@ -0,0 +1,64 @@
+import numpy as np
+from services.user_item_matrix import lookup_positions, splice_rows
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+class RatersIndex:
+    """Inverted index from movieId to the sorted userIds that rated it.
+
+    Raters of the movie at position i are ``user_ids[indptr[i]:indptr[i + 1]]``,
+    so a lookup costs time proportional to the number of raters returned.
+    """
+
+    def __init__(self, movie_ids, indptr, user_ids):
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.user_ids = np.asarray(user_ids, dtype=np.int32)
+        self._sorter = np.argsort(self.movie_ids, kind='stable')
+
+    @classmethod
+    def from_user_item_matrix(cls, user_item_matrix):
+        """Build the index from the column (movie) layout of the rating matrix."""
+        csc = user_item_matrix.csc
+        csc.sort_indices()
+        user_ids = user_item_matrix.user_ids[csc.indices]
+        if np.any(np.diff(user_item_matrix.user_ids) < 0):
+            # Users appended by incremental ingestion break the row order; re-sort per movie
+            columns = np.repeat(np.arange(csc.shape[1]), np.diff(csc.indptr))
+            user_ids = user_ids[np.lexsort((user_ids, columns))]
+        index = cls(user_item_matrix.movie_ids, csc.indptr, user_ids)
+        logging.info(f"Raters index built for {len(index.movie_ids)} movies")
+        return index
+
+    def updated(self, user_item_matrix, touched_movies):
+        """Return a new index with only the raters of ``touched_movies`` recomputed.
+
+        ``user_item_matrix`` is the matrix this index was built from with a batch of
+        ratings applied; touched positions past the end are movies it appended.
+        """
+        touched = np.unique(np.asarray(touched_movies, dtype=np.int64))
+        columns = user_item_matrix.csc[:, touched]
+        user_ids = user_item_matrix.user_ids[columns.indices]
+        column_of = np.repeat(np.arange(len(touched)), np.diff(columns.indptr))
+        indptr, (user_ids,) = splice_rows(
+            self.indptr, [self.user_ids], touched,
+            columns.indptr, [user_ids[np.lexsort((user_ids, column_of))]], len(user_item_matrix.movie_ids))
+        logging.info(f"Raters index updated for {len(touched)} movies")
+        return RatersIndex(user_item_matrix.movie_ids, indptr, user_ids)
+
+    def union(self, movie_ids):
+        """Return the sorted, de-duplicated userIds that rated any of ``movie_ids``."""
+        positions = lookup_positions(self.movie_ids, list(movie_ids), sorter=self._sorter)
+        positions = positions[positions >= 0]
+        if len(positions) == 0:
+            return np.empty(0, dtype=np.int32)
+        if len(positions) == 1:
+            return self.user_ids[self.indptr[positions[0]]:self.indptr[positions[0] + 1]]
+        return np.unique(np.concatenate([
+            self.user_ids[self.indptr[position]:self.indptr[position + 1]] for position in positions
+        ]))
+
+    def union_groups(self, movie_id_groups):
+        """Return the de-duplicated userIds that rated a movie of any group."""
+        return self.union({movie_id for group in movie_id_groups for movie_id in group})
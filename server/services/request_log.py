@@ -0,0 +1,57 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import os
+import queue
+import random
+from config import Config
+
+class RequestLog:
+    """Sampled request log written to a file by a background thread.
+
+    Only a ``sample_rate`` fraction of requests, plus every request slower than
+    ``slow_seconds``, is logged with its payload. Records are put on an in-memory
+    queue and written by a listener thread, so the request thread never does file I/O.
+    """
+
+    def __init__(self, path=Config.REQUEST_LOG_PATH, sample_rate=Config.REQUEST_LOG_SAMPLE_RATE,
+                 slow_seconds=Config.REQUEST_LOG_SLOW_SECONDS):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+
+        self._handler = QueueHandler(queue.SimpleQueue())
+        self._listener = None
+        self._start_listener()
+        atexit.register(self.close)
+        # The listener thread does not survive a fork; pre-forked workers (serve.py) start their own
+        os.register_at_fork(after_in_child=self._start_listener)
+
+        self.logger = logging.getLogger('recommender.requests')
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self._handler)
+        # Kept out of the root handlers, which write synchronously
+        self.logger.propagate = False
+
+    def _start_listener(self):
+        self._handler.queue = queue.SimpleQueue()
+        # Opened on the first sampled record, so importing the app creates no file
+        file_handler = logging.FileHandler(self.path, delay=True)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+        self._listener = QueueListener(self._handler.queue, file_handler)
+        self._listener.start()
+
+    def close(self):
+        """Write out the queued records and stop the listener thread; safe to call twice."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+    def record(self, endpoint, payload, status, seconds, count=None):
+        """Log one finished request if it is slow or falls in the sample."""
+        slow = seconds >= self.slow_seconds
+        if not slow and random.random() >= self.sample_rate:
+            return
+        self.logger.log(logging.WARNING if slow else logging.INFO,
+                        "%s %s in %.1fms, %s recommendations: %s",
+                        endpoint, status, seconds * 1000, count, payload)
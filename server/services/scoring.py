@@ -0,0 +1,46 @@
+import numpy as np
+
+def top_n(scores, n):
+    """Return positions of the ``n`` largest scores, best first, in O(len + n log n)."""
+    scores = np.asarray(scores)
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+def top_n_per_row(score_matrix, n, exclude=None):
+    """Return the ``n`` best (columns, scores) of every row of a sparse CSR score matrix.
+
+    ``exclude`` is an optional per-row sequence of column positions to drop first.
+    Only stored entries with a positive score are candidates.
+    """
+    results = []
+    indptr, indices, data = score_matrix.indptr, score_matrix.indices, score_matrix.data
+    for row in range(score_matrix.shape[0]):
+        columns = indices[indptr[row]:indptr[row + 1]]
+        values = data[indptr[row]:indptr[row + 1]]
+        keep = values > 0
+        if exclude is not None and len(exclude[row]):
+            keep &= ~np.isin(columns, exclude[row])
+        columns, values = columns[keep], values[keep]
+        best = top_n(values, n)
+        results.append((columns[best], values[best]))
+    return results
+
+def normalize_rows(matrix):
+    """L2-normalize the rows of a dense array or a scipy sparse matrix; all-zero rows stay zero.
+
+    Matches ``sklearn.preprocessing.normalize(matrix)`` (sparse input comes back as CSR)
+    without importing scikit-learn on the serving path.
+    """
+    if hasattr(matrix, 'tocsr'):
+        matrix = matrix.tocsr(copy=True)
+        norms = np.sqrt(np.bincount(np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr)),
+                                    weights=matrix.data.astype(np.float64) ** 2, minlength=matrix.shape[0]))
+        scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        matrix.data *= np.repeat(scale, np.diff(matrix.indptr)).astype(matrix.dtype)
+        return matrix
+    matrix = np.asarray(matrix)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1).astype(matrix.dtype)
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from services.artifacts import arrays_to_sparse, load_artifact, save_artifact, sparse_to_arrays
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+def lookup_positions(ids, values, sorter=None):
+    """Map values to their positions in ``ids``; values that are missing map to -1.
+
+    ``ids`` must be sorted unless ``sorter`` (its argsort) is given.
+    """
+    values = np.asarray(values, dtype=np.int64).ravel()
+    if len(ids) == 0:
+        return np.full(len(values), -1, dtype=np.int32)
+    positions = np.searchsorted(ids, values, sorter=sorter).clip(max=len(ids) - 1)
+    if sorter is not None:
+        positions = sorter[positions]
+    return np.where(ids[positions] == values, positions, -1).astype(np.int32)
+
+def splice_rows(indptr, arrays, rows, row_indptr, row_arrays, n_rows):
+    """Replace some rows of a CSR-style layout, copying the untouched rows slice by slice.
+
+    ``indptr``/``arrays`` hold the current rows and ``row_indptr``/``row_arrays`` the new
+    content of ``rows`` (sorted positions; positions past the end are appended). Untouched
+    rows are never re-sorted or re-indexed. Returns ``(indptr, arrays)`` for ``n_rows`` rows.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    old_rows = len(indptr) - 1
+    counts = np.zeros(n_rows, dtype=np.int64)
+    counts[:old_rows] = np.diff(indptr)
+    counts[rows] = np.diff(row_indptr)
+    new_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_indptr[1:])
+
+    new_arrays = [np.empty(new_indptr[-1], dtype=array.dtype) for array in arrays]
+    start = 0
+    for end in np.append(rows[rows < old_rows], old_rows):
+        if end > start:
+            for new, old in zip(new_arrays, arrays):
+                new[new_indptr[start]:new_indptr[end]] = old[indptr[start]:indptr[end]]
+        start = end + 1
+
+    lengths = np.diff(row_indptr)
+    destination = np.repeat(new_indptr[rows] - row_indptr[:-1], lengths) + np.arange(row_indptr[-1])
+    for new, values in zip(new_arrays, row_arrays):
+        new[destination] = values
+    return new_indptr, new_arrays
+
+class UserItemMatrix:
+    """Sparse user x movie rating matrix with compact userId/movieId indexes.
+
+    Rows follow the ``user_ids`` array and columns the ``movie_ids`` array, so memory
+    scales with the number of ratings rather than users x movies. Both arrays are sorted
+    when built from a ratings frame; users and movies added by :meth:`with_ratings` are
+    appended at the end so existing positions stay valid.
+    """
+
+    def __init__(self, matrix, user_ids, movie_ids):
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        self.user_ids = np.asarray(user_ids, dtype=np.int32)
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int32)
+        self._user_sorter = np.argsort(self.user_ids, kind='stable')
+        self._movie_sorter = np.argsort(self.movie_ids, kind='stable')
+        self._csc = None
+
+    @classmethod
+    def from_ratings(cls, ratings_df):
+        """Build the matrix from a ratings frame with userId, movieId and rating columns."""
+        # pivot() refused duplicate pairs; keep the latest rating instead of summing them
+        ratings_df = ratings_df.drop_duplicates(subset=['userId', 'movieId'], keep='last')
+        user_ids, rows = np.unique(ratings_df['userId'].to_numpy(), return_inverse=True)
+        movie_ids, cols = np.unique(ratings_df['movieId'].to_numpy(), return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (ratings_df['rating'].to_numpy(dtype=np.float32), (rows, cols)),
+            shape=(len(user_ids), len(movie_ids)),
+            dtype=np.float32,
+        )
+        # Explicit zero ratings would have been indistinguishable from "not rated" in the dense pivot
+        matrix.eliminate_zeros()
+        return cls(matrix, user_ids, movie_ids)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    @property
+    def csc(self):
+        """Column-major copy of the matrix, built on first use."""
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def user_positions(self, user_ids):
+        """Map userIds to row positions; unknown ids map to -1."""
+        return lookup_positions(self.user_ids, user_ids, sorter=self._user_sorter)
+
+    def movie_positions(self, movie_ids):
+        """Map movieIds to column positions; unknown ids map to -1."""
+        return lookup_positions(self.movie_ids, movie_ids, sorter=self._movie_sorter)
+
+    def with_ratings(self, user_ids, movie_ids, ratings):
+        """Return a new matrix with a batch of ratings applied, plus the touched positions.
+
+        A new rating for an existing (user, movie) pair replaces the old one; the last event
+        wins within the batch. Unknown users and movies get new rows/columns at the end.
+        Returns ``(matrix, touched_user_positions, touched_movie_positions)``.
+        """
+        events = pd.DataFrame({'userId': user_ids, 'movieId': movie_ids, 'rating': ratings})
+        events = events.drop_duplicates(subset=['userId', 'movieId'], keep='last')
+        event_users = events['userId'].to_numpy(dtype=np.int64)
+        event_movies = events['movieId'].to_numpy(dtype=np.int64)
+        event_ratings = events['rating'].to_numpy(dtype=np.float32)
+
+        rows = self.user_positions(event_users)
+        columns = self.movie_positions(event_movies)
+        new_users = np.unique(event_users[rows < 0])
+        new_movies = np.unique(event_movies[columns < 0])
+        rows[rows < 0] = len(self.user_ids) + np.searchsorted(new_users, event_users[rows < 0])
+        columns[columns < 0] = len(self.movie_ids) + np.searchsorted(new_movies, event_movies[columns < 0])
+        shape = (len(self.user_ids) + len(new_users), len(self.movie_ids) + len(new_movies))
+
+        updated = UserItemMatrix(
+            self._with_events(self.matrix, rows, columns, event_ratings, shape),
+            np.concatenate([self.user_ids, new_users]),
+            np.concatenate([self.movie_ids, new_movies]),
+        )
+        if self._csc is not None:
+            # Carry the column layout forward the same way instead of rebuilding it on next use
+            updated._csc = self._with_events(self._csc.T, columns, rows, event_ratings, shape[::-1]).T
+        return updated, np.unique(rows), np.unique(columns)
+
+    @staticmethod
+    def _with_events(matrix, rows, columns, values, shape):
+        """Apply rating events to a CSR matrix, rewriting only the rows they touch."""
+        touched = np.unique(rows)
+        existing = touched[touched < matrix.shape[0]]
+        block = matrix[existing]
+        # Touched rows that are new start empty; they sort after the existing ones
+        block_indptr = np.concatenate([block.indptr, np.full(len(touched) - len(existing), block.indptr[-1])])
+        block = sparse.csr_matrix((block.data, block.indices, block_indptr), shape=(len(touched), shape[1]))
+        event_matrix = sparse.csr_matrix(
+            (values, (np.searchsorted(touched, rows), columns)),
+            shape=block.shape,
+            dtype=np.float32,
+        )
+        # Drop the replaced ratings, then add the new ones
+        replaced = block.multiply(event_matrix.astype(bool)).tocsr()
+        block = (block - replaced + event_matrix).tocsr()
+        block.eliminate_zeros()
+        block.sort_indices()
+
+        indptr, (data, indices) = splice_rows(
+            matrix.indptr, [matrix.data, matrix.indices], touched,
+            block.indptr, [block.data, block.indices], shape[0])
+        return sparse.csr_matrix((data, indices, indptr), shape=shape, dtype=np.float32)
+
+    def save(self, directory, metadata=None):
+        """Persist the matrix and its id arrays as a memory-mappable artifact."""
+        arrays = sparse_to_arrays('ratings', self.matrix)
+        arrays.update({'user_ids': self.user_ids, 'movie_ids': self.movie_ids})
+        save_artifact(directory, arrays, metadata)
+
+    @classmethod
+    def load(cls, directory, mmap=True, expected=None):
+        """Open a matrix saved with :meth:`save`; returns None if it is missing or stale."""
+        artifact = load_artifact(directory, mmap=mmap, expected=expected)
+        if artifact is None:
+            return None
+        arrays, _ = artifact
+        return cls(arrays_to_sparse('ratings', arrays), arrays['user_ids'], arrays['movie_ids'])
+
+    def to_dataframe(self):
+        """Dense DataFrame adapter matching the old ``pivot().fillna(0)`` layout.
+
+        Only meant for small matrices (notebooks, debugging); it allocates users x movies.
+        """
+        return pd.DataFrame(
+            self.matrix.toarray(),
+            index=pd.Index(self.user_ids, name='userId'),
+            columns=pd.Index(self.movie_ids, name='movieId'),
+        )